@@ -0,0 +1,65 @@
+"""
+Measures the per-request overhead of building a sequence generator for short inputs by comparing translation latency
+with and without reusing the generators.
+
+python -m benchmarks.generator_setup --model-name septilang [--src et --tgt en --repeats 50]
+"""
+import logging
+from time import perf_counter
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from nmt_worker import Translator, read_model_config
+
+SENTENCES = ["Tere!", "Kuidas läheb?", "Aitäh."]
+
+
+def parse_args():
+    parser = ArgumentParser(description="Sequence generator setup cost benchmark.",
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model-name', type=str, required=True,
+                        help="The model to load. Refers to the model name in the config file.")
+    parser.add_argument('--model-config', type=str, default='config/config.yaml',
+                        help="The model config YAML file to load.")
+    parser.add_argument('--src', type=str, default='et', help="Source language code used by the model.")
+    parser.add_argument('--tgt', type=str, default='en', help="Target language code used by the model.")
+    parser.add_argument('--repeats', type=int, default=50, help="The number of translation requests to time.")
+    return parser.parse_args()
+
+
+def time_requests(model, src: str, tgt: str, repeats: int, reuse: bool) -> float:
+    timings = []
+    for _ in range(repeats):
+        if not reuse:
+            model._generators.clear()
+        t1 = perf_counter()
+        model.translate(SENTENCES, src_language=src, tgt_language=tgt)
+        timings.append(perf_counter() - t1)
+    return sum(timings) / len(timings)
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    translator = Translator(read_model_config(args.model_config, args.model_name))
+    model = translator.model
+
+    model.translate(SENTENCES, src_language=args.src, tgt_language=args.tgt)  # warmup
+
+    t1 = perf_counter()
+    for _ in range(args.repeats):
+        model._generators.clear()
+        model.get_generator(args.src, args.tgt)
+    setup = (perf_counter() - t1) / args.repeats
+
+    rebuilt = time_requests(model, args.src, args.tgt, args.repeats, reuse=False)
+    reused = time_requests(model, args.src, args.tgt, args.repeats, reuse=True)
+
+    print(f"Generator setup:              {setup * 1000:.2f} ms")
+    print(f"Request, generator rebuilt:   {rebuilt * 1000:.2f} ms")
+    print(f"Request, generator reused:    {reused * 1000:.2f} ms")
+    print(f"Overhead saved per request:   {(rebuilt - reused) * 1000:.2f} ms ({(1 - reused / rebuilt) * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares the speed of the punctuation normalizer with the reference implementation that applies each regular
+expression separately, and checks that both produce identical output.
+
+python -m benchmarks.normalization [--input-file corpus.txt --repeats 5]
+"""
+from time import perf_counter
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
+
+from nmt_worker.normalization import normalize, normalize_reference
+
+SENTENCES = [
+    "Tere! Kuidas läheb?",
+    "„Eesti keel” on  ilus ( vähemalt minu arvates ) .",
+    "Hind tõusis 12 % – see on rohkem kui oodatud…",
+    "The ‘quick’ brown fox — as they say — jumps over the lazy dog !",
+    "Das ist «sehr» gut : wir sehen uns um 12:00 Uhr.",
+    "Привет , как дела ? Всё хорошо !",
+    "Hyvää päivää! Tämä on ''testi''.",
+]
+
+
+def parse_args():
+    parser = ArgumentParser(description="Punctuation normalization benchmark.",
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--input-file', type=FileType('r', encoding='utf-8'), default=None,
+                        help="A text file with one sentence per line, a small built-in sample is used by default.")
+    parser.add_argument('--repeats', type=int, default=5, help="The number of passes over the sentences.")
+    return parser.parse_args()
+
+
+def time_function(function, sentences, repeats: int) -> float:
+    t1 = perf_counter()
+    for _ in range(repeats):
+        for sentence in sentences:
+            function(sentence)
+    return perf_counter() - t1
+
+
+def main():
+    args = parse_args()
+    sentences = [line.rstrip('\n') for line in args.input_file] if args.input_file else SENTENCES * 10000
+
+    mismatches = sum(normalize(sentence) != normalize_reference(sentence) for sentence in sentences)
+    reference = time_function(normalize_reference, sentences, args.repeats)
+    optimized = time_function(normalize, sentences, args.repeats)
+    n = len(sentences) * args.repeats
+
+    print(f"Sentences: {len(sentences)}, mismatches: {mismatches}")
+    print(f"Reference: {round(reference / n * 1e6, 2)} µs per sentence")
+    print(f"Optimized: {round(optimized / n * 1e6, 2)} µs per sentence ({round(reference / optimized, 2)}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares the speed and quality of a model with and without dynamic int8 quantization on a held-out text file with
+one sentence per line. Quality is reported as the BLEU score of the quantized model against the original model's output
+and, if a reference translation file is given, as the BLEU scores of both models against the reference.
+
+python -m benchmarks.quantization --model-name septilang --input-file test.et --src et --tgt en [--reference test.en]
+"""
+import logging
+from time import perf_counter
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import torch
+from sacrebleu.metrics import BLEU
+
+from nmt_worker import Translator, read_model_config
+
+
+def parse_args():
+    parser = ArgumentParser(description="Dynamic int8 quantization speed and quality comparison.",
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model-name', type=str, required=True,
+                        help="The model to load. Refers to the model name in the config file.")
+    parser.add_argument('--model-config', type=str, default='config/config.yaml',
+                        help="The model config YAML file to load.")
+    parser.add_argument('--input-file', type=str, required=True, help="A text file with one sentence per line.")
+    parser.add_argument('--reference', type=str, default=None, help="An optional reference translation file.")
+    parser.add_argument('--src', type=str, required=True, help="Source language code used by the model.")
+    parser.add_argument('--tgt', type=str, required=True, help="Target language code used by the model.")
+    parser.add_argument('--threads', type=int, default=None, help="The number of intra-op threads.")
+    return parser.parse_args()
+
+
+def translate(model_config, sentences, src: str, tgt: str):
+    translator = Translator(model_config)
+    translator.model.translate(sentences[:10], src_language=src, tgt_language=tgt)  # warmup
+    t1 = perf_counter()
+    translations = translator.model.translate(sentences, src_language=src, tgt_language=tgt)
+    return translations, perf_counter() - t1
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    with open(args.input_file, 'r', encoding='utf-8') as f:
+        sentences = [line.strip() for line in f]
+    references = None
+    if args.reference:
+        with open(args.reference, 'r', encoding='utf-8') as f:
+            references = [line.strip() for line in f]
+
+    model_config = read_model_config(args.model_config, args.model_name)
+    results = {}
+    for quantize in (False, True):
+        config = model_config.copy(deep=True)
+        config.cpu.quantize = quantize
+        results[quantize] = translate(config, sentences, args.src, args.tgt)
+
+    bleu = BLEU()
+    (fp32, fp32_time), (int8, int8_time) = results[False], results[True]
+    print(f"fp32: {fp32_time:.2f} s, {len(sentences) / fp32_time:.2f} sentences/s")
+    print(f"int8: {int8_time:.2f} s, {len(sentences) / int8_time:.2f} sentences/s "
+          f"(speedup {fp32_time / int8_time:.2f}x)")
+    print(f"int8 vs fp32 output: {bleu.corpus_score(int8, [fp32])}")
+    if references:
+        print(f"fp32 vs reference: {bleu.corpus_score(fp32, [references])}")
+        print(f"int8 vs reference: {bleu.corpus_score(int8, [references])}")
+
+
+if __name__ == '__main__':
+    main()
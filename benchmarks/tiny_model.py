@@ -0,0 +1,110 @@
+"""
+Builds a tiny randomly initialised multilingual model with its own sentencepiece models and dictionaries so that the
+worker can be benchmarked offline without a trained checkpoint. The translations are meaningless, but the model goes
+through the same preprocessing, batching, generation and postprocessing code as a real one.
+"""
+import os
+import random
+from typing import List, Tuple, Sequence
+
+import torch
+import sentencepiece as spm
+from fairseq import options, tasks
+from fairseq.dataclass.utils import convert_namespace_to_omegaconf
+
+from nmt_worker.config import ModelConfig, Domain, GenerationProfile
+from nmt_worker.modular_interface import ModularHubInterface
+
+WORDS = {
+    'et': ["tere", "maailm", "kuidas", "läheb", "väga", "hästi", "aitäh", "ülikool", "eesti", "keel", "tõlge", "masin",
+           "täna", "homme", "ilm", "on", "ja", "see", "mis", "kes", "kodu", "tööl", "linn", "Tartu", "Tallinn"],
+    'en': ["hello", "world", "how", "are", "you", "very", "well", "thanks", "university", "language", "machine",
+           "translation", "today", "tomorrow", "weather", "is", "and", "this", "what", "who", "home", "city"],
+    'de': ["hallo", "welt", "wie", "geht", "es", "sehr", "gut", "danke", "universität", "sprache", "maschine",
+           "übersetzung", "heute", "morgen", "wetter", "ist", "und", "das", "was", "wer", "haus", "stadt"],
+}
+LANGUAGE_CODES = {'est': 'et', 'eng': 'en', 'ger': 'de'}
+
+ARCHITECTURE = [
+    '--encoder-layers', '2', '--decoder-layers', '2',
+    '--encoder-embed-dim', '64', '--decoder-embed-dim', '64',
+    '--encoder-ffn-embed-dim', '128', '--decoder-ffn-embed-dim', '128',
+    '--encoder-attention-heads', '2', '--decoder-attention-heads', '2',
+]
+
+
+def random_sentence(language: str, rng: random.Random, min_words: int = 3, max_words: int = 15) -> str:
+    """
+    A random sentence of the language's words, or of English words for other languages.
+    """
+    words = [rng.choice(WORDS.get(language, WORDS['en'])) for _ in range(rng.randint(min_words, max_words))]
+    return ' '.join(words).capitalize() + rng.choice(['.', '.', '.', '?', '!'])
+
+
+def _train_sentencepiece(path: str, language: str, vocab_size: int, seed: int) -> spm.SentencePieceProcessor:
+    rng = random.Random(seed)
+    corpus = os.path.join(path, f'corpus.{language}')
+    with open(corpus, 'w', encoding='utf-8') as f:
+        for _ in range(2000):
+            f.write(random_sentence(language, rng) + '\n')
+    spm.SentencePieceTrainer.train(input=corpus, model_prefix=os.path.join(path, f'sp-model.{language}'),
+                                   vocab_size=vocab_size, character_coverage=1.0, hard_vocab_limit=False,
+                                   minloglevel=2)
+    return spm.SentencePieceProcessor(model_file=os.path.join(path, f'sp-model.{language}.model'))
+
+
+def _write_dictionary(path: str, language: str, sp_model: spm.SentencePieceProcessor):
+    with open(os.path.join(path, f'dict.{language}.txt'), 'w', encoding='utf-8') as f:
+        for piece_id in range(sp_model.get_piece_size()):
+            if not (sp_model.is_control(piece_id) or sp_model.is_unknown(piece_id)):
+                f.write(f'{sp_model.id_to_piece(piece_id)} 1\n')
+
+
+def build_tiny_model(path: str, language_pairs: List[Tuple[str, str]] = (('et', 'en'), ('en', 'et')),
+                     vocab_size: int = 200, seed: int = 1, extra_args: Sequence[str] = ()) -> ModularHubInterface:
+    """
+    Create the sentencepiece models and dictionaries for the language pairs in the given directory and build a
+    randomly initialised MultilingualTransformerModel with separate encoders and decoders for each language.
+
+    :param extra_args: additional fairseq training arguments, e.g. ['--decoder-langtok']
+    """
+    os.makedirs(path, exist_ok=True)
+    torch.manual_seed(seed)
+    languages = sorted({language for pair in language_pairs for language in pair})
+    sp_models = {}
+    for language in languages:
+        sp_models[language] = _train_sentencepiece(path, language, vocab_size, seed)
+        _write_dictionary(path, language, sp_models[language])
+
+    parser = options.get_training_parser()
+    args = options.parse_args_and_arch(parser, [
+        path, '--task', 'multilingual_translation', '--arch', 'multilingual_transformer',
+        '--lang-pairs', ','.join(f'{src}-{tgt}' for src, tgt in language_pairs), *ARCHITECTURE, *extra_args
+    ])
+    task = tasks.setup_task(args)
+    model = task.build_model(args)
+    model.eval()
+
+    return ModularHubInterface(models=[model], task=task, cfg=convert_namespace_to_omegaconf(args),
+                               sp_models=sp_models)
+
+
+def tiny_model_config(path: str, language_pairs: List[Tuple[str, str]] = (('et', 'en'), ('en', 'et'))) -> ModelConfig:
+    """
+    A model config that matches the tiny model. The maximum output length is proportional to the input length, as
+    a random model rarely generates the end of sentence token.
+    """
+    codes = {code: name for name, code in LANGUAGE_CODES.items()}
+    return ModelConfig(
+        model_name='tiny',
+        checkpoint_path=os.path.join(path, 'checkpoint.pt'),
+        dict_dir=path,
+        sentencepiece_dir=path,
+        sentencepiece_prefix='sp-model',
+        domains=[Domain(name='general', language_pairs=[f'{codes[src]}-{codes[tgt]}' for src, tgt in language_pairs])],
+        language_codes={codes[language]: language for pair in language_pairs for language in pair},
+        generation_profiles={
+            'default': GenerationProfile(beam=5, max_len_a=1.2, max_len_b=5),
+            'fast': GenerationProfile(beam=2, max_len_a=1.2, max_len_b=5),
+        },
+    )
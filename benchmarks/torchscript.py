@@ -0,0 +1,75 @@
+"""
+Compares the speed and output of a model with the Python sequence generators and with generators exported to
+TorchScript (see nmt_worker.export) on a text file with one sentence per line. The TorchScript output is compared to the
+Python output with BLEU and the share of identical translations. The script exits with an error if the BLEU score is
+below --min-bleu.
+
+python -m benchmarks.torchscript --model-name septilang --torchscript-dir models/septilang-torchscript \
+    --input-file test.et --src et --tgt en
+"""
+import sys
+import logging
+from time import perf_counter
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import torch
+from sacrebleu.metrics import BLEU
+
+from nmt_worker import Translator, read_model_config
+
+
+def parse_args():
+    parser = ArgumentParser(description="TorchScript generator speed and equivalence check.",
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model-name', type=str, required=True,
+                        help="The model to load. Refers to the model name in the config file.")
+    parser.add_argument('--model-config', type=str, default='config/config.yaml',
+                        help="The model config YAML file to load.")
+    parser.add_argument('--torchscript-dir', type=str, required=True, help="The directory of exported generators.")
+    parser.add_argument('--input-file', type=str, required=True, help="A text file with one sentence per line.")
+    parser.add_argument('--src', type=str, required=True, help="Source language code used by the model.")
+    parser.add_argument('--tgt', type=str, required=True, help="Target language code used by the model.")
+    parser.add_argument('--min-bleu', type=float, default=99.0,
+                        help="The minimum BLEU score of the TorchScript output against the Python output.")
+    parser.add_argument('--threads', type=int, default=None, help="The number of intra-op threads.")
+    return parser.parse_args()
+
+
+def translate(model_config, sentences, src: str, tgt: str):
+    translator = Translator(model_config)
+    for _ in range(3):  # the TorchScript profiling executor optimizes the graphs during the first runs
+        translator.model.translate(sentences[:50], src_language=src, tgt_language=tgt)
+    t1 = perf_counter()
+    translations = translator.model.translate(sentences, src_language=src, tgt_language=tgt)
+    return translations, perf_counter() - t1
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    with open(args.input_file, 'r', encoding='utf-8') as f:
+        sentences = [line.strip() for line in f]
+
+    model_config = read_model_config(args.model_config, args.model_name)
+    results = {}
+    for torchscript_dir in (None, args.torchscript_dir):
+        config = model_config.copy(deep=True)
+        config.cpu.torchscript_dir = torchscript_dir
+        results[torchscript_dir] = translate(config, sentences, args.src, args.tgt)
+
+    (python, python_time), (scripted, scripted_time) = results[None], results[args.torchscript_dir]
+    bleu = BLEU().corpus_score(scripted, [python])
+    identical = sum(a == b for a, b in zip(python, scripted)) / len(sentences)
+    print(f"Python:      {python_time:.2f} s, {len(sentences) / python_time:.2f} sentences/s")
+    print(f"TorchScript: {scripted_time:.2f} s, {len(sentences) / scripted_time:.2f} sentences/s "
+          f"(speedup {python_time / scripted_time:.2f}x)")
+    print(f"TorchScript vs Python output: {bleu}, identical: {identical:.2%}")
+    if bleu.score < args.min_bleu:
+        sys.exit(f"BLEU {bleu.score:.2f} is below the tolerance of {args.min_bleu}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Measures end-to-end request latency and throughput of the translation worker for different input sizes, request
+formats, tagged input types, batch budgets and thread counts. Runs against a model from the config file or a tiny
+randomly initialised model that is built on the fly, so it also works offline on a CPU-only machine. The results
+are printed and can be saved as JSON to compare different commits.
+
+python -m benchmarks.worker --tiny [--output results.json]
+python -m benchmarks.worker --model-name septilang --src est --tgt eng --sizes short long --threads 4 8
+"""
+import json
+import random
+import logging
+import platform
+import subprocess
+import tempfile
+from time import perf_counter
+from datetime import datetime
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from typing import List, Dict, Any, Union
+
+import torch
+
+from nmt_worker import Translator, read_model_config
+from nmt_worker.schemas import Request
+from nmt_worker.instrumentation import Timings
+from benchmarks.tiny_model import build_tiny_model, tiny_model_config, random_sentence
+
+# the number of sentences in each paragraph and the number of paragraphs in a request
+SIZES = {
+    'short': (1, 1),
+    'medium': (5, 1),
+    'long': (10, 5),
+}
+TAGS = {
+    'sdl': lambda idx, word: f'<{idx} id={idx}>{word}</{idx}>' if idx % 2 else f'<{idx} id={idx}/>{word}',
+    'memoq': lambda idx, word: f'<b>{word}</b>' if idx % 2 else f'<br/>{word}',
+}
+
+
+def parse_args():
+    parser = ArgumentParser(description="End-to-end translation worker benchmark.",
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    model = parser.add_mutually_exclusive_group(required=True)
+    model.add_argument('--model-name', type=str, help="The model to load. Refers to the model name in the config file.")
+    model.add_argument('--tiny', action='store_true', help="Use a tiny randomly initialised model.")
+    parser.add_argument('--model-config', type=str, default='config/config.yaml',
+                        help="The model config YAML file to load.")
+    parser.add_argument('--src', type=str, default='est', help="Source language code used in requests.")
+    parser.add_argument('--tgt', type=str, default='eng', help="Target language code used in requests.")
+    parser.add_argument('--sizes', nargs='+', choices=SIZES.keys(), default=list(SIZES.keys()),
+                        help="Request sizes to benchmark.")
+    parser.add_argument('--formats', nargs='+', choices=['string', 'list'], default=['string', 'list'],
+                        help="Send the text as a single string or as a list of paragraphs.")
+    parser.add_argument('--input-types', nargs='+', choices=['plain', *TAGS.keys()], default=['plain', 'sdl'],
+                        help="Request input types, tags are added to the text for tagged types.")
+    parser.add_argument('--max-tokens', nargs='+', type=int, default=[1000], help="Batch token budgets.")
+    parser.add_argument('--threads', nargs='+', type=int, default=[torch.get_num_threads()],
+                        help="The numbers of intra-op threads.")
+    parser.add_argument('--requests', type=int, default=20, help="The number of timed requests in each scenario.")
+    parser.add_argument('--warmup', type=int, default=2, help="The number of untimed requests in each scenario.")
+    parser.add_argument('--seed', type=int, default=1, help="The random seed used to generate requests.")
+    parser.add_argument('--output', type=str, default=None, help="A JSON file to save the results to.")
+    return parser.parse_args()
+
+
+def make_text(language: str, size: str, input_type: str, request_format: str,
+              rng: random.Random) -> Union[str, List[str]]:
+    n_sentences, n_paragraphs = SIZES[size]
+    paragraphs = []
+    for _ in range(n_paragraphs):
+        sentences = [random_sentence(language, rng) for _ in range(n_sentences)]
+        if input_type in TAGS:
+            sentences = [' '.join(TAGS[input_type](idx, word) if rng.random() < 0.2 else word
+                                  for idx, word in enumerate(sentence.split(' ')))
+                         for sentence in sentences]
+        paragraphs.append(' '.join(sentences))
+    return paragraphs if request_format == 'list' else '\n\n'.join(paragraphs)
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def run_scenario(translator: Translator, src: str, tgt: str, language: str, size: str, input_type: str,
+                 request_format: str, n_requests: int, warmup: int, rng: random.Random) -> Dict[str, Any]:
+    latencies = []
+    stages = {}
+    n_sentences = 0
+    total = 0.0
+    for idx in range(warmup + n_requests):
+        text = make_text(language, size, input_type, request_format, rng)
+        request = Request(text=text, src=src, tgt=tgt, application=None if input_type == 'plain' else input_type)
+        timings = Timings()
+        t1 = perf_counter()
+        prepared = translator.prepare_request(request, timings)
+        translator.process_prepared([prepared])
+        duration = perf_counter() - t1
+        if idx < warmup:
+            continue
+        latencies.append(duration)
+        total += duration
+        n_sentences += prepared.n_sentences
+        for stage, stage_duration in timings.all_stages().items():
+            stages[stage] = stages.get(stage, 0.0) + stage_duration
+
+    return {
+        'requests': n_requests,
+        'sentences': n_sentences,
+        'duration': round(total, 4),
+        'requests_per_second': round(n_requests / total, 3),
+        'sentences_per_second': round(n_sentences / total, 3),
+        'latency': {
+            'mean': round(total / n_requests, 5),
+            'p50': round(percentile(latencies, 50), 5),
+            'p95': round(percentile(latencies, 95), 5),
+            'p99': round(percentile(latencies, 99), 5),
+        },
+        'stages': {stage: round(duration / n_requests, 5) for stage, duration in stages.items()},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.tiny:
+        path = tempfile.mkdtemp(prefix='tiny-model-')
+        model_config = tiny_model_config(path)
+        translator = Translator(model_config, model=build_tiny_model(path))
+    else:
+        model_config = read_model_config(args.model_config, args.model_name)
+        model_config.cache = None
+        translator = Translator(model_config)
+    translator.cache = None
+    language = model_config.language_codes[args.src]
+
+    metadata = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'model': model_config.model_name,
+        'device': str(translator.model.device),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'src': args.src,
+        'tgt': args.tgt,
+    }
+    results = []
+    rng = random.Random(args.seed)
+    # the swept token budget is used for all language pairs and is not limited by the number of sentences
+    model_config.batching.language_pairs = {}
+    translator.batch_budgets = {}
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for max_tokens in args.max_tokens:
+            model_config.batching.max_tokens = max_tokens
+            model_config.batching.max_sentences = max_tokens
+            for size in args.sizes:
+                for input_type in args.input_types:
+                    for request_format in args.formats:
+                        scenario = {'threads': threads, 'max_tokens': max_tokens, 'size': size,
+                                    'input_type': input_type, 'format': request_format}
+                        result = run_scenario(translator, args.src, args.tgt, language, size, input_type,
+                                              request_format, args.requests, args.warmup, rng)
+                        results.append({**scenario, **result})
+                        print(f"{json.dumps(scenario)}: {result['sentences_per_second']} sentences/s, "
+                              f"p50 {result['latency']['p50']} s, p95 {result['latency']['p95']} s, "
+                              f"p99 {result['latency']['p99']} s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'metadata': metadata, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,28 +10,47 @@ def parse_args():
         formatter_class=ArgumentDefaultsHelpFormatter
     )
 
-    parser.add_argument('--model-name', type=str, required=True,
-                        help="The model to load. Refers to the model name in the config file.")
+    parser.add_argument('--model-name', type=str, nargs='+', required=True,
+                        help="The model to load. Refers to the model name in the config file. If several models are "
+                             "given, requests are dispatched to them by language pair and domain.")
 
     parser.add_argument('--model-config', type=FileType('r'), default='config/config.yaml',
                         help="The model config YAML file to load.")
     parser.add_argument('--log-config', type=FileType('r'), default='config/logging.prod.ini',
                         help="Path to log config file.")
+    parser.add_argument('--max-loaded-models', type=int, default=None,
+                        help="The maximum number of models kept in memory when serving several models. The least "
+                             "recently used model is unloaded when another one is needed. All models are kept loaded "
+                             "by default.")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="If set, the RabbitMQ worker exports Prometheus metrics on this port at /metrics.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="The number of RabbitMQ worker processes that share a single copy of the model.")
+    parser.add_argument('--async-consumer', action='store_true',
+                        help="Handle RabbitMQ messaging on an asynchronous I/O loop and run translations in a separate "
+                             "thread pool, keeping the connection alive during long translations.")
+    parser.add_argument('--ready-file', type=str, default=None,
+                        help="A file that is created when the RabbitMQ worker starts consuming requests and removed "
+                             "when it stops, e.g. for a readiness probe.")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="The number of intra-op threads used by each worker process. By default, the "
+                             "MKL_NUM_THREADS environment variable or the number of CPU cores is used.")
 
     file_args = parser.add_argument_group("Local file translation arguments, if the following arguments "
                                           "exist, local file translation is started. Otherwise a RabbitMQ worker is "
                                           "started")
-    file_args.add_argument('--input-file', type=FileType('r'),
-                           help="Path to the input text file.")
-    file_args.add_argument('--output-file', type=FileType('w'),
-                           help="Path to the output text file.")
+    file_args.add_argument('--input-file', type=FileType('r', encoding='utf-8'),
+                           help="Path to the input text file, use '-' to read from stdin.")
+    file_args.add_argument('--output-file', type=FileType('w', encoding='utf-8'),
+                           help="Path to the output text file, use '-' to write to stdout.")
     file_args.add_argument('--input-lang', type=str,
                            help="Input language code")
     file_args.add_argument('--output-lang', type=str,
                            help="Output language code.")
+    file_args.add_argument('--batch-lines', type=int, default=200,
+                           help="The approximate number of lines translated and written at once.")
 
     # TODO: add domain and input_type?
-    # TODO: add stdin / stdout?
 
     return parser.parse_args()
 
@@ -42,27 +61,46 @@ def main():
     args = parse_args()
 
     logging.config.fileConfig(args.log_config.name)
-    model_config = read_model_config(args.model_config.name, args.model_name)
+    model_configs = [read_model_config(args.model_config.name, model_name) for model_name in args.model_name]
 
-    translator = Translator(model_config)
+    if len(model_configs) > 1:
+        from nmt_worker.multi_model import MultiModelTranslator
+        translator = MultiModelTranslator(model_configs, max_loaded_models=args.max_loaded_models)
+    else:
+        translator = Translator(model_configs[0])
 
     if args.input_file or args.output_file:
         assert args.input_file and args.output_file and args.input_lang and \
                args.output_lang, "Both input and output files must be defined."
-        from nmt_worker import Request
+        from nmt_worker.streaming import translate_stream
 
-        input_text = args.input_file.read()
-        request = Request(
-            text=input_text,
-            src=args.input_lang,
-            tgt=args.output_lang
-        )
-        response = translator.process_request(request)
-        args.output_file.write(response.result)
+        translator.warmup()
+        translate_stream(translator, args.input_file, args.output_file, src=args.input_lang, tgt=args.output_lang,
+                         max_lines=args.batch_lines)
     else:
-        from nmt_worker import MQConsumer, MQConfig
+        from nmt_worker import MQConsumer, MQConfig, readiness
+        readiness.configure(args.ready_file)
         mq_config = MQConfig()
-        consumer = MQConsumer(
+        consumer_class = MQConsumer
+        if args.async_consumer:
+            from nmt_worker.async_mq_consumer import AsyncMQConsumer
+            consumer_class = AsyncMQConsumer
+
+        if args.workers > 1:
+            from nmt_worker.pool import run_worker_pool
+            run_worker_pool(translator, mq_config, workers=args.workers, threads=args.threads,
+                            metrics_port=args.metrics_port, consumer_class=consumer_class)
+            return
+
+        if args.threads:
+            import torch
+            torch.set_num_threads(args.threads)
+        if args.metrics_port:
+            from nmt_worker.metrics import start_metrics_server
+            start_metrics_server(args.metrics_port)
+        translator.warmup()
+
+        consumer = consumer_class(
             translator=translator,
             mq_config=mq_config
         )
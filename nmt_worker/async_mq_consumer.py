@@ -0,0 +1,185 @@
+import logging
+import functools
+from sys import getsizeof
+from time import sleep
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Tuple
+
+import pika
+from pika import SelectConnection
+
+from nmt_worker import readiness
+from nmt_worker.config import MQConfig
+from nmt_worker.translator import Translator
+from nmt_worker.mq_consumer import MQConsumer
+from nmt_worker.batching import PendingBatch
+from nmt_worker.priority import PriorityGate
+from nmt_worker.instrumentation import Timings, PREFETCH_COUNT
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 5
+
+
+class AsyncMQConsumer(MQConsumer):
+    def __init__(self, translator: Translator, mq_config: MQConfig):
+        """
+        A RabbitMQ consumer that handles messaging on an asynchronous I/O loop and runs translations in a thread pool.
+        The connection stays responsive (including heartbeats) while long requests are translated and responses are
+        published from the I/O loop once the translation is finished.
+        """
+        super().__init__(translator, mq_config)
+        # batches of different requests are only generated concurrently with several threads and micro-batching
+        if self.mq_config.max_priority and self.mq_config.translation_threads > 1 and self.batcher:
+            self.gate = PriorityGate()
+        self.executor = ThreadPoolExecutor(max_workers=self.mq_config.translation_threads,
+                                           thread_name_prefix='translation')
+        self._stopping = False
+
+    def start(self):
+        """
+        Connect to RabbitMQ and start listening for requests. Automatically tries to reconnect if the connection
+        is lost.
+        """
+        while not self._stopping:
+            try:
+                self._connect()
+                self.connection.ioloop.start()
+            except KeyboardInterrupt:
+                logger.info('Interrupted by user. Exiting...')
+                self._stopping = True
+                if self.connection.is_open:
+                    self.connection.close()
+                    self.connection.ioloop.start()  # stopped by _on_connection_closed
+                self.executor.shutdown(wait=False)
+                break
+            logger.info(f'Trying to reconnect in {RECONNECT_DELAY} seconds.')
+            sleep(RECONNECT_DELAY)
+
+    def _connect(self):
+        logger.info(f'Connecting to RabbitMQ server: {{host: {self.mq_config.host}, port: {self.mq_config.port}}}')
+        self.connection = SelectConnection(
+            self._connection_parameters(),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_open_error,
+            on_close_callback=self._on_connection_closed
+        )
+
+    def _on_connection_open(self, connection: SelectConnection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection: SelectConnection, error: Exception):
+        logger.error(error)
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection: SelectConnection, reason: Exception):
+        self.channel = None
+        readiness.set_not_ready()
+        if not self._stopping:
+            logger.error(f'Connection closed: {reason}')
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel: pika.channel.Channel):
+        """
+        (Re)declares the exchange for the service and a queue for the worker binding any alternative routing keys as
+        needed and starts consuming.
+        """
+        self.channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.queue_declare(queue=self.queue_name, arguments=self._queue_arguments(),
+                              callback=self._on_queue_declared)
+
+    def _on_channel_closed(self, channel: pika.channel.Channel, reason: Exception):
+        logger.warning(f'Channel closed: {reason}')
+        if self.connection.is_open:
+            self.connection.close()
+
+    def _on_queue_declared(self, _):
+        self.channel.exchange_declare(exchange=self.mq_config.exchange, exchange_type='direct',
+                                      callback=self._on_exchange_declared)
+
+    def _on_exchange_declared(self, _):
+        # synchronous requests are sent in order, so it is enough to wait for the last binding
+        for route in self.routing_keys[:-1]:
+            self.channel.queue_bind(exchange=self.mq_config.exchange, queue=self.queue_name, routing_key=route)
+        self.channel.queue_bind(exchange=self.mq_config.exchange, queue=self.queue_name,
+                                routing_key=self.routing_keys[-1], callback=self._on_bound)
+
+    def _on_bound(self, _):
+        self.channel.basic_qos(prefetch_count=self.mq_config.prefetch_count, callback=self._on_qos)
+
+    def _on_qos(self, _):
+        PREFETCH_COUNT.set(self.mq_config.prefetch_count)
+        if self.batcher:
+            self.batcher.pop_all()  # unacknowledged messages are redelivered after reconnecting
+        self.channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_message)
+        readiness.set_ready()
+
+    def _on_message(self, channel: pika.channel.Channel, method: pika.spec.Basic.Deliver,
+                    properties: pika.BasicProperties, body: bytes):
+        """
+        Submit the request to the translation thread pool. If micro-batching is enabled, the request is preprocessed
+        in the thread pool and added to a pending batch on the I/O loop instead.
+        """
+        logger.info(f"Received request: {{id: {properties.correlation_id}, size: {getsizeof(body)} bytes}}")
+        timings = Timings()
+        if not self.batcher:
+            future = self.executor.submit(lambda: [self._process(properties, body, timings)])
+            future.add_done_callback(functools.partial(self._on_done, channel, [(method, properties)]))
+            return
+
+        future = self.executor.submit(self._prepare, properties, body, timings)
+        future.add_done_callback(lambda done: channel.connection.ioloop.add_callback_threadsafe(
+            functools.partial(self._on_prepared, channel, method, properties, done)))
+
+    def _on_prepared(self, channel: pika.channel.Channel, method: pika.spec.Basic.Deliver,
+                     properties: pika.BasicProperties, future: Future):
+        """
+        Called on the I/O loop when a request has been preprocessed, adds it to a pending batch.
+        """
+        if channel is not self.channel or not channel.is_open:
+            logger.warning(f'Channel closed before request {properties.correlation_id} was preprocessed, '
+                           f'the request will be redelivered.')
+            return
+        try:
+            prepared = future.result()
+        except Exception as e:
+            prepared = self._internal_error(e).encode()
+        if isinstance(prepared, bytes):
+            self._respond(channel, method, properties, prepared)
+            return
+
+        batch, created = self._add_to_batch(method, properties, prepared)
+        if self.batcher.is_full(batch):
+            self._submit_batch(channel, batch)
+        elif created:
+            self.connection.ioloop.call_later(self.batcher.max_wait,
+                                              functools.partial(self._submit_batch, channel, batch))
+
+    def _submit_batch(self, channel: pika.channel.Channel, batch: PendingBatch):
+        if not self._pop_batch(batch):
+            return
+        future = self.executor.submit(self._process_batch, batch)
+        future.add_done_callback(functools.partial(
+            self._on_done, channel, [(method, properties) for method, properties, _ in batch.items]))
+
+    def _on_done(self, channel: pika.channel.Channel,
+                 messages: List[Tuple[pika.spec.Basic.Deliver, pika.BasicProperties]], future: Future):
+        """
+        Called from a translation thread, schedules the responses to be published on the I/O loop.
+        """
+        try:
+            responses = future.result()
+        except Exception as e:
+            responses = [self._internal_error(e).encode()] * len(messages)
+        channel.connection.ioloop.add_callback_threadsafe(
+            functools.partial(self._respond_all, channel, messages, responses))
+
+    def _respond_all(self, channel: pika.channel.Channel,
+                     messages: List[Tuple[pika.spec.Basic.Deliver, pika.BasicProperties]], responses: List[bytes]):
+        if not channel.is_open:
+            logger.warning(f'Channel closed before {len(messages)} response(s) could be sent, '
+                           f'the requests will be redelivered.')
+            return
+        for (method, properties), response in zip(messages, responses):
+            self._respond(channel, method, properties, response)
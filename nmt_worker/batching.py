@@ -0,0 +1,65 @@
+from typing import Dict, List, Tuple, Any, Optional
+
+
+class PendingBatch:
+    def __init__(self, key: Tuple[str, str]):
+        """
+        A group of requests with the same language pair that are waiting to be translated together.
+        """
+        self.key = key
+        self.items: List[Any] = []
+        self.sentences = 0
+        self.tokens = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item: Any, sentences: int, tokens: int):
+        self.items.append(item)
+        self.sentences += sentences
+        self.tokens += tokens
+
+
+class MicroBatcher:
+    def __init__(self, max_sentences: int, max_tokens: int, max_wait: float):
+        """
+        Collects requests into batches by language pair. A batch is considered full once it reaches the sentence or
+        token budget and should otherwise be flushed when it is older than max_wait seconds.
+        """
+        self.max_sentences = max_sentences
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self.pending: Dict[Tuple[str, str], PendingBatch] = {}
+
+    def add(self, key: Tuple[str, str], item: Any, sentences: int, tokens: int) -> Tuple[PendingBatch, bool]:
+        """
+        Add an item to the pending batch of its language pair.
+
+        :return: the batch the item was added to and whether it is a newly created batch
+        """
+        created = key not in self.pending
+        if created:
+            self.pending[key] = PendingBatch(key)
+        batch = self.pending[key]
+        batch.add(item, sentences, tokens)
+        return batch, created
+
+    @property
+    def n_pending(self) -> int:
+        return sum(len(batch) for batch in self.pending.values())
+
+    def is_full(self, batch: PendingBatch) -> bool:
+        return batch.sentences >= self.max_sentences or batch.tokens >= self.max_tokens
+
+    def pop(self, batch: PendingBatch) -> Optional[PendingBatch]:
+        """
+        Remove the batch from the pending batches. Returns None if the batch has already been flushed.
+        """
+        if self.pending.get(batch.key) is not batch:
+            return None
+        return self.pending.pop(batch.key)
+
+    def pop_all(self) -> List[PendingBatch]:
+        batches = list(self.pending.values())
+        self.pending = {}
+        return batches
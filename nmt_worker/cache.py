@@ -0,0 +1,138 @@
+import json
+import logging
+import sqlite3
+import hashlib
+import threading
+from time import time
+from collections import OrderedDict
+from typing import Optional, Tuple, List, Any
+
+logger = logging.getLogger(__name__)
+
+PRUNE_INTERVAL = 600  # seconds between removing expired and excess entries from the persistent cache
+
+
+class TranslationCache:
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = None, path: Optional[str] = None,
+                 max_persistent_size: Optional[int] = None):
+        """
+        A sentence-level translation cache. Entries are kept in memory up to max_size using LRU eviction and expire
+        after ttl seconds. If a path is given, entries are also stored in an SQLite database that persists between
+        restarts and is used to fill the in-memory cache. Expired entries and the oldest entries above
+        max_persistent_size are removed from the database periodically. Database errors, e.g. when the database is
+        locked by another worker process, are logged and the lookup is treated as a miss or the write is skipped.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_persistent_size = max_persistent_size
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._pruned = 0.0
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS translations "
+                                 "(key TEXT PRIMARY KEY, translation TEXT NOT NULL, created REAL NOT NULL)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS translations_created ON translations (created)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Persistent translation cache {path} could not be opened, using memory only: {e}")
+                self._db = None
+                return
+            with self._lock:
+                self._prune()
+            logger.info(f"Persistent translation cache opened: {path}")
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time() - created > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                entry = self._get_persistent(key)
+                if entry is not None:
+                    self._set(key, entry)
+            if entry is None:
+                return None
+
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, translation: str):
+        self.put_many([(key, translation)])
+
+    def put_many(self, items: List[Tuple[str, str]]):
+        created = time()
+        with self._lock:
+            for key, translation in items:
+                self._set(key, (translation, created))
+            if self._db is not None:
+                try:
+                    self._db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?)",
+                                         [(key, translation, created) for key, translation in items])
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self._rollback(f"Translation cache write skipped: {e}")
+                    return
+                if created - self._pruned > PRUNE_INTERVAL:
+                    self._prune()
+
+    def _set(self, key: str, entry: Tuple[str, float]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _prune(self):
+        self._pruned = time()
+        try:
+            if self.ttl is not None:
+                self._db.execute("DELETE FROM translations WHERE created < ?", (self._pruned - self.ttl,))
+            if self.max_persistent_size is not None:
+                self._db.execute("DELETE FROM translations WHERE key IN "
+                                 "(SELECT key FROM translations ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                                 (self.max_persistent_size,))
+            self._db.commit()
+        except sqlite3.Error as e:
+            self._rollback(f"Translation cache pruning skipped: {e}")
+
+    def _get_persistent(self, key: str) -> Optional[Tuple[str, float]]:
+        try:
+            row = self._db.execute("SELECT translation, created FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1]):
+                self._db.execute("DELETE FROM translations WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+        except sqlite3.Error as e:
+            self._rollback(f"Translation cache lookup failed: {e}")
+            return None
+        return row[0], row[1]
+
+    def _rollback(self, message: str):
+        logger.warning(message)
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """
+        Close the persistent database, the in-memory entries remain usable.
+        """
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -1,8 +1,8 @@
 import yaml
 from yaml.loader import SafeLoader
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-from pydantic import BaseSettings, BaseModel
+from pydantic import BaseSettings, BaseModel, conint, root_validator
 
 
 class MQConfig(BaseSettings):
@@ -16,6 +16,17 @@ class MQConfig(BaseSettings):
     exchange: str = 'translation'
     heartbeat: int = 60
     connection_name: str = 'Translation worker'
+    prefetch_count: int = 1  # values above 1 enable cross-request micro-batching
+    batch_max_sentences: int = 100
+    batch_max_tokens: int = 2000
+    batch_max_wait: float = 0.05  # seconds
+    translation_threads: int = 1  # the number of concurrent translations when using the asynchronous consumer
+    # values above 0 declare a priority queue, and with the asynchronous consumer, translation_threads and
+    # prefetch_count above 1, let higher-priority requests take turns between the generation batches of lower-priority
+    # ones
+    max_priority: int = 0
+    # request priorities by application, used when the message does not have a priority property
+    application_priorities: Dict[str, int] = {}
 
     class Config:
         env_file = 'config/.env'
@@ -25,6 +36,50 @@ class MQConfig(BaseSettings):
 class Domain(BaseModel):
     name: str
     language_pairs: List[str]  # a list of hyphen-separated input/output language pairs
+    generation_profile: Optional[str] = None  # the default generation profile of the domain
+
+
+class GenerationProfile(BaseModel):
+    beam: int = 5
+    # the maximum output length is max_len_a * source_length + max_len_b, the model's values are used if not set
+    max_len_a: Optional[float] = None
+    max_len_b: Optional[int] = None
+
+    class Config:
+        frozen = True  # profiles are used to group requests with the same settings
+
+
+class CacheConfig(BaseModel):
+    max_size: int = 10000  # the number of sentences kept in memory
+    ttl: Optional[float] = None  # the number of seconds after which a cached translation expires
+    path: Optional[str] = None  # an SQLite database file for a persistent cache
+    max_persistent_size: Optional[int] = 1000000  # the number of sentences kept in the persistent cache
+
+
+class BatchBudget(BaseModel):
+    max_sentences: int = 10  # the maximum number of sentences in a batch
+    max_tokens: int = 1000  # the maximum number of subword tokens in a batch, including padding
+
+
+class BatchConfig(BatchBudget):
+    language_pairs: Dict[str, BatchBudget] = {}  # budgets for hyphen-separated language pairs, e.g. "est-eng"
+    calibrate: bool = False  # select the default budget by timing calibration batches at startup
+    calibration_budgets: List[int] = [250, 500, 1000, 2000, 4000, 8000]  # token budgets tried in calibration
+
+
+class PipelineConfig(BaseModel):
+    threads: conint(ge=1) = 2  # the number of text preprocessing and postprocessing threads
+    queue_size: conint(ge=1) = 2  # the maximum number of chunks prepared ahead or waiting for postprocessing
+    chunk_sentences: conint(ge=1) = 64  # the number of sentences translated at once
+
+
+class CPUConfig(BaseModel):
+    quantize: bool = False  # apply dynamic int8 quantization to the feed-forward and output projection layers
+    threads: Optional[int] = None  # the number of intra-op threads, MKL_NUM_THREADS or the number of cores by default
+    interop_threads: Optional[int] = None
+    # a directory of sequence generators exported with `python -m nmt_worker.export`, which are used instead of
+    # building the generators in Python when available
+    torchscript_dir: Optional[str] = None
 
 
 class ModelConfig(BaseModel):
@@ -35,6 +90,32 @@ class ModelConfig(BaseModel):
     sentencepiece_prefix: str
     domains: List[Domain]
     language_codes: Dict[str, str]
+    cache: Optional[CacheConfig] = None  # sentence-level translation caching is disabled by default
+    selective_loading: bool = False  # only load the modules of the language pairs listed in domains
+    lazy_loading: bool = False  # load other language pairs on first use when selective loading is enabled
+    cpu: CPUConfig = CPUConfig()  # settings that are applied when the model is not running on a GPU
+    batching: BatchConfig = BatchConfig()
+    snapshot_path: Optional[str] = None  # a prepared model file that is created on first start for faster startup
+    warmup_batches: int = 0  # warmup batches per language pair and generation profile before consuming requests
+    pipeline: Optional[PipelineConfig] = None  # overlap text processing with inference, disabled by default
+    skip_untranslatable: bool = False  # copy numbers, URLs, e-mail addresses and punctuation without translation
+    max_sentence_length: Optional[int] = None  # longer sentences (in subword tokens) are split, disabled by default
+    generation_profiles: Dict[str, GenerationProfile] = {
+        'default': GenerationProfile(),
+        'fast': GenerationProfile(beam=2, max_len_a=1.5, max_len_b=10),
+    }
+    default_generation_profile: str = 'default'  # used if neither the request nor its domain specifies a profile
+
+    @root_validator(skip_on_failure=True)
+    def check_generation_profiles(cls, values):
+        profiles = values['generation_profiles']
+        names = [values['default_generation_profile']] + [domain.generation_profile for domain in values['domains']
+                                                            if domain.generation_profile is not None]
+        unknown = sorted(set(name for name in names if name not in profiles))
+        if unknown:
+            raise ValueError(f"Unknown generation profiles: {', '.join(unknown)}. Available generation profiles: "
+                             f"{', '.join(profiles)}.")
+        return values
 
 
 def read_model_config(file_path: str, model_name: str) -> ModelConfig:
@@ -0,0 +1,96 @@
+"""
+Exports the sequence generators of a model to TorchScript for each configured language pair and generation profile.
+The exported generators contain the encoder, the decoder with its incremental decoding state and the beam search, and
+are used instead of the Python implementation when the directory is set as `cpu.torchscript_dir` in the model
+configuration. All generators are saved to a single file, in which the encoder and decoder of each language are stored
+once. Quantization settings of the model configuration are applied before the export.
+
+python -m nmt_worker.export --model-name septilang --output-dir models/septilang-torchscript
+"""
+import os
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from typing import Tuple, Iterable
+
+import torch
+from torch.nn import Module, ModuleDict
+from fairseq.models import FairseqEncoderDecoderModel
+
+from nmt_worker.config import read_model_config, GenerationProfile
+from nmt_worker.modular_interface import ModularHubInterface, TORCHSCRIPT_FILE, torchscript_generator_name
+from nmt_worker.translator import Translator
+
+logger = logging.getLogger(__name__)
+
+
+class ScriptableEncoderDecoderModel(FairseqEncoderDecoderModel):
+    """
+    A language pair model of a MultilingualTransformerModel with a forward signature that TorchScript can compile.
+    """
+    def forward(self, src_tokens, src_lengths, prev_output_tokens):
+        encoder_out = self.encoder(src_tokens, src_lengths=src_lengths)
+        return self.decoder(prev_output_tokens, encoder_out=encoder_out)
+
+
+class GeneratorSet(Module):
+    def __init__(self, generators: ModuleDict):
+        super().__init__()
+        self.generators = generators
+
+    def forward(self):
+        pass
+
+
+def export_generators(model: ModularHubInterface, language_pairs: Iterable[Tuple[str, str]],
+                      profiles: Iterable[GenerationProfile], output_dir: str) -> str:
+    """
+    Script the sequence generators of all language pairs and generation profiles and save them to a single file.
+
+    :return: the path of the exported file
+    """
+    generators = ModuleDict()
+    for src, tgt in language_pairs:
+        if not model.has_language_pair(src, tgt):
+            model.load_language_pair(src, tgt)
+        pair_models = [ScriptableEncoderDecoderModel(multi_model.models[f"{src}-{tgt}"].encoder,
+                                                     multi_model.models[f"{src}-{tgt}"].decoder)
+                       for multi_model in model.models]
+        for module in (module for pair_model in pair_models for module in pair_model.modules()):
+            # prepare_for_inference_ sets need_attn to print_alignment, which is None by default
+            if getattr(module, "need_attn", False) is None:
+                module.need_attn = False
+        for profile in set(profiles):
+            generators[torchscript_generator_name(src, tgt, **profile.dict())] = \
+                model.build_generator(src, tgt, **profile.dict(), models=pair_models)
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, TORCHSCRIPT_FILE)
+    torch.jit.save(torch.jit.script(GeneratorSet(generators)), path)
+    logger.info(f"Exported {len(generators)} generators to {path}")
+    return path
+
+
+def parse_args():
+    parser = ArgumentParser(description="Export the sequence generators of a model to TorchScript.",
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model-name', type=str, required=True,
+                        help="The model to export. Refers to the model name in the config file.")
+    parser.add_argument('--model-config', type=str, default='config/config.yaml',
+                        help="The model config YAML file to load.")
+    parser.add_argument('--output-dir', type=str, required=True, help="The directory for the exported generators.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    model_config = read_model_config(args.model_config, args.model_name)
+    model_config.cpu.torchscript_dir = None
+    translator = Translator(model_config)
+    export_generators(translator.model, translator.language_pairs, model_config.generation_profiles.values(),
+                      args.output_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+"""
+Detection of segments that do not need to be translated and can be copied to the output as they are.
+"""
+import re
+
+PASSTHROUGH_PATTERNS = (
+    # numbers, dates, punctuation and other text without any letters
+    re.compile(r'[\W\d_]+'),
+    # URLs
+    re.compile(r'(?:[a-z][a-z0-9+.-]*://|www\.)\S+', re.IGNORECASE),
+    # e-mail addresses
+    re.compile(r'(?:mailto:)?[\w.+-]+@[\w-]+(?:\.[\w-]+)+', re.IGNORECASE),
+)
+
+
+def is_passthrough(sentence: str) -> bool:
+    """
+    Check whether a sentence is empty or consists only of a number, URL, e-mail address or punctuation.
+    """
+    sentence = sentence.strip()
+    return not sentence or any(pattern.fullmatch(sentence) for pattern in PASSTHROUGH_PATTERNS)
@@ -0,0 +1,197 @@
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Iterator, Sequence
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+REGISTRY: List['Metric'] = []
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        """
+        A base class for metrics that keep a separate value for each combination of label values. All metrics are
+        added to the registry that is exported by the metrics endpoint.
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label)) for label in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            lines.append(f'{self.name}{_format_labels(dict(zip(self.labels, key)))} {value}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, value: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        """
+        A thread-safe histogram with fixed buckets that aggregates observations separately for each combination of
+        label values.
+        """
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0, 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def collect(self) -> Iterator[Tuple[Dict[str, str], List[int], float, int]]:
+        """
+        Iterate over the label values, bucket counts (non-cumulative, the last one being +Inf), sum and count of
+        observations.
+        """
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        for key, counts, total, count in values:
+            yield dict(zip(self.labels, key)), counts, total, count
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type}']
+        for labels, counts, total, count in self.collect():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": bound})} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    values = ','.join(f'{label}="{_escape(str(value))}"' for label, value in labels.items())
+    return f'{{{values}}}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics() -> str:
+    """
+    Render all registered metrics in the Prometheus text exposition format.
+    """
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+STAGE_DURATION = Histogram('nmt_stage_duration_seconds', 'Time spent in each processing stage of a request.',
+                           labels=('stage',))
+UNIT_COUNT = Histogram('nmt_batch_units', 'Requests, sentences and tokens per translation call.', labels=('unit',),
+                       buckets=COUNT_BUCKETS)
+REQUEST_DURATION = Histogram('nmt_request_duration_seconds', 'Request processing time by language pair and domain.',
+                             labels=('src', 'tgt', 'domain'))
+SENTENCES = Counter('nmt_sentences_total', 'The number of translated sentences.')
+TOKENS = Counter('nmt_tokens_total', 'The number of processed subword tokens.', labels=('side',))
+CACHE_LOOKUPS = Counter('nmt_cache_lookups_total', 'Translation cache lookups by result.', labels=('result',))
+BATCH_FILL = Histogram('nmt_batch_fill_ratio', 'The share of the micro-batch budget used when a batch is flushed.',
+                       buckets=RATIO_BUCKETS)
+PENDING_MESSAGES = Gauge('nmt_pending_messages', 'Prefetched messages waiting in a micro-batch.')
+PREFETCH_COUNT = Gauge('nmt_prefetch_count', 'The maximum number of unacknowledged messages.')
+LOADED_MODELS = Gauge('nmt_loaded_models', 'The number of models that are currently loaded.')
+READY = Gauge('nmt_ready', 'Whether the worker is consuming requests.')
+MODEL_LOAD_TIME = Gauge('nmt_model_load_seconds', 'The time it took to load the model.', labels=('model',))
+
+
+class Timings:
+    def __init__(self):
+        """
+        Per-stage durations and unit counts (requests, sentences, tokens) of a request or a translation call.
+        """
+        self.start = perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.shared_stages: Dict[str, float] = {}  # stages of translation calls shared with other requests
+        self.counts: Dict[str, int] = {}
+
+    def elapsed(self) -> float:
+        return perf_counter() - self.start
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0.0) + perf_counter() - start
+
+    def count(self, unit: str, value: int):
+        self.counts[unit] = self.counts.get(unit, 0) + value
+
+    def update(self, other: 'Timings', shared: bool = False):
+        """
+        Add the stage durations of another object, e.g. a chunk of this request. If shared, the other object is a
+        translation call that included this request and other requests, whose stages are recorded by the call itself
+        and not by record of this object.
+        """
+        for stage, duration in other.stages.items():
+            target = self.shared_stages if shared else self.stages
+            target[stage] = target.get(stage, 0.0) + duration
+        for stage, duration in other.shared_stages.items():
+            self.shared_stages[stage] = self.shared_stages.get(stage, 0.0) + duration
+
+    def all_stages(self) -> Dict[str, float]:
+        """
+        The durations of all stages, including the shared ones.
+        """
+        stages = dict(self.shared_stages)
+        for stage, duration in self.stages.items():
+            stages[stage] = stages.get(stage, 0.0) + duration
+        return stages
+
+    def record(self, *stages: str):
+        """
+        Add the durations of the given stages (all stages by default) to the aggregated histogram. Shared stages are
+        not included.
+        """
+        for stage in stages or self.stages:
+            if stage in self.stages:
+                STAGE_DURATION.observe(self.stages[stage], stage=stage)
+
+    def record_counts(self):
+        for unit, value in self.counts.items():
+            UNIT_COUNT.observe(value, unit=unit)
+
+    def __str__(self):
+        stages = ', '.join(f'{stage}: {round(duration, 4)} s' for stage, duration in self.all_stages().items())
+        counts = ', '.join(f'{unit}: {value}' for unit, value in self.counts.items())
+        return f'{{{", ".join(filter(None, (stages, counts)))}}}'
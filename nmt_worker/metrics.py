@@ -0,0 +1,42 @@
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from nmt_worker.instrumentation import render_metrics
+from nmt_worker.readiness import is_ready
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/ready':
+            ready = is_ready()
+            self._send(200 if ready else 503, b'ready' if ready else b'not ready', 'text/plain; charset=utf-8')
+        elif path == '/metrics':
+            self._send(200, render_metrics().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+        else:
+            self.send_error(404)
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """
+    Start an HTTP server in a background thread that exports all metrics at /metrics in the Prometheus text format.
+    /ready responds with 200 while the worker is consuming requests and with 503 otherwise.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -1,12 +1,21 @@
+import os
 import logging
 import copy
-from typing import Dict, List, Iterator, Any, Optional
+import hashlib
+import itertools
+import tempfile
+import threading
+import weakref
+from typing import Dict, List, Iterator, Any, Optional, Tuple, Callable, Union
 
 from fairseq.data import Dictionary, LanguagePairDataset, FairseqDataset
-from fairseq import utils, search, hub_utils
+from fairseq import utils, search, checkpoint_utils
+from fairseq.dataclass.utils import overwrite_args_by_name
+from fairseq.models import FairseqEncoderDecoderModel
 from fairseq.models.multilingual_transformer import MultilingualTransformerModel
-from fairseq.tasks.multilingual_translation import MultilingualTranslationTask
+from fairseq.tasks.multilingual_translation import MultilingualTranslationTask, _lang_token_index
 from fairseq.sequence_generator import SequenceGenerator
+from fairseq.modules import MultiheadAttention
 
 from omegaconf import open_dict, DictConfig
 
@@ -14,10 +23,41 @@ from sentencepiece import SentencePieceProcessor
 
 import torch
 from torch import Tensor, LongTensor
-from torch.nn import ModuleList, Module
+from torch.nn import ModuleList, Module, Linear
+from torch.jit import ScriptModule
+
+from .instrumentation import Timings
+from .scheduling import BatchScheduler
+from .priority import batch_turn
 
 logger = logging.getLogger(__name__)
 
+SNAPSHOT_VERSION = 1
+TORCHSCRIPT_FILE = "generators.pt"
+
+# dictionaries and sentencepiece models that are in use, keyed by their type and contents
+_shared_assets = weakref.WeakValueDictionary()
+_shared_assets_lock = threading.Lock()
+
+
+def _shared_asset(kind: str, content: bytes, load: Callable[[], Any]) -> Any:
+    """
+    Return an asset with identical contents that was loaded by another model if it is still in use, otherwise load
+    it. This way models that are trained with the same vocabularies share a single copy.
+    """
+    key = (kind, hashlib.sha256(content).hexdigest())
+    with _shared_assets_lock:
+        asset = _shared_assets.get(key)
+        if asset is None:
+            asset = load()
+            _shared_assets[key] = asset
+        return asset
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
 
 class ModularHubInterface(Module):
     def __init__(
@@ -25,8 +65,13 @@ class ModularHubInterface(Module):
             models: List[MultilingualTransformerModel],
             task: MultilingualTranslationTask,
             cfg: DictConfig,
-            sp_models: Dict[str, SentencePieceProcessor]
+            sp_models: Dict[str, SentencePieceProcessor],
+            source: Optional[Dict[str, str]] = None,
     ):
+        """
+        :param source: the model, sentencepiece and dictionary paths used to load language pairs that are missing
+        from the models on first use. Lazy loading is disabled if it is not given.
+        """
         super().__init__()
 
         self.sp_models = sp_models
@@ -43,6 +88,20 @@ class ModularHubInterface(Module):
             self.task.max_positions(), *[model.max_positions() for model in self.models]
         )
 
+        self._piece_indices: Dict[str, LongTensor] = {}
+        self._sentencepiece_ids: Dict[str, List[int]] = {}
+        for lang in self.sp_models:
+            self._build_vocabulary_maps(lang)
+
+        self._generators: Dict[Tuple[str, str, int, Optional[float], Optional[int]],
+                               Union[SequenceGenerator, ScriptModule]] = {}
+        self.scripted_generators: Optional[ScriptModule] = None
+        self._source = source
+        # all language pairs of the checkpoint if the model was loaded from one
+        self.checkpoint_language_pairs: Optional[List[Tuple[str, str]]] = None
+        self._load_lock = threading.Lock()
+        self.quantized = False
+
         self.register_buffer("_float_tensor", torch.tensor([0], dtype=torch.float))
 
     @classmethod
@@ -51,27 +110,255 @@ class ModularHubInterface(Module):
             model_path: str,
             sentencepiece_prefix: str,
             dictionary_path: str,
+            language_pairs: Optional[List[Tuple[str, str]]] = None,
+            lazy_loading: bool = False,
     ):
-        x = hub_utils.from_pretrained(
-            "./",
-            checkpoint_file=model_path,
-            archive_map={},
-            data_name_or_path=dictionary_path,
-            task="multilingual_translation"
-        )
-
-        sp_models = {
-            lang: SentencePieceProcessor(
-                model_file=f"{sentencepiece_prefix}.{lang}.model"
-            ) for lang in x["task"].langs
-        }
+        """
+        Load the model from a checkpoint. If language pairs are given, only the encoders, decoders, dictionaries and
+        sentencepiece models of these language pairs are loaded. Other pairs can then be loaded on first use by
+        enabling lazy loading.
+        """
+        source = dict(model_path=model_path, sentencepiece_prefix=sentencepiece_prefix,
+                      dictionary_path=dictionary_path)
+        x, sp_models = cls._load(**source, language_pairs=language_pairs)
 
-        return cls(
+        model = cls(
             models=x["models"],
             task=x["task"],
             cfg=x["args"],
             sp_models=sp_models,
+            source=source if lazy_loading else None,
         )
+        model.checkpoint_language_pairs = x["language_pairs"]
+        return model
+
+    @staticmethod
+    def _load(
+            model_path: str,
+            sentencepiece_prefix: str,
+            dictionary_path: str,
+            language_pairs: Optional[List[Tuple[str, str]]] = None,
+    ) -> Tuple[Dict[str, Any], Dict[str, SentencePieceProcessor]]:
+        overrides = {"data": os.path.abspath(dictionary_path), "task": "multilingual_translation"}
+        state = checkpoint_utils.load_checkpoint_to_cpu(model_path, overrides)
+        task_cfg = state["cfg"].task if state.get("cfg") is not None else state["args"]
+        lang_pairs = task_cfg.lang_pairs.split(",") if isinstance(task_cfg.lang_pairs, str) else task_cfg.lang_pairs
+        checkpoint_pairs = [tuple(lang_pair.split("-")) for lang_pair in lang_pairs]
+
+        if language_pairs is not None:
+            if getattr(task_cfg, "encoder_langtok", None) is not None or getattr(task_cfg, "decoder_langtok", False):
+                # the task adds a language token for each language of the loaded pairs to every dictionary, so the
+                # dictionaries would not match the checkpoint unless all of its languages are loaded
+                raise ValueError("Selective and lazy loading are not supported for models trained with "
+                                 "--encoder-langtok or --decoder-langtok.")
+            # the task only builds models for these pairs and the weights of other pairs are skipped when the
+            # checkpoint is loaded into a MultilingualTransformerModel
+            lang_pairs = ",".join(f"{src}-{tgt}" for src, tgt in language_pairs)
+            if state.get("cfg") is not None:
+                overwrite_args_by_name(state["cfg"], {"lang_pairs": lang_pairs})
+            else:
+                state["args"].lang_pairs = lang_pairs
+        models, args, task = checkpoint_utils.load_model_ensemble_and_task([model_path], arg_overrides=overrides,
+                                                                           state=state)
+        x = {"args": args, "task": task, "models": models, "language_pairs": checkpoint_pairs}
+
+        for lang in task.langs:
+            # keyed on the final symbols, the task appends language tokens of the model to the dictionary file
+            loaded = task.dicts[lang]
+            task.dicts[lang] = _shared_asset("dictionary", "\n".join(loaded.symbols).encode("utf-8"),
+                                             lambda: loaded)
+        for model in x["models"]:
+            for key, pair_model in model.models.items():
+                src_lang, tgt_lang = key.split("-")
+                pair_model.encoder.dictionary = task.dicts[src_lang]
+                pair_model.decoder.dictionary = task.dicts[tgt_lang]
+
+        sp_models = {
+            lang: _shared_asset(
+                "sentencepiece", _read_bytes(f"{sentencepiece_prefix}.{lang}.model"),
+                lambda path=f"{sentencepiece_prefix}.{lang}.model": SentencePieceProcessor(model_file=path)
+            ) for lang in task.langs
+        }
+
+        return x, sp_models
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # generators are rebuilt on first use, they reference the models and scripted generators cannot be pickled
+        state = self.__dict__.copy()
+        state["_generators"] = {}
+        del state["_load_lock"]
+        if "scripted_generators" in state["_modules"]:
+            state["_modules"] = state["_modules"].copy()
+            del state["_modules"]["scripted_generators"]
+            state["scripted_generators"] = None
+        # the state container of fairseq tasks cannot be unpickled, it is rebuilt from its contents in __setstate__
+        state["task"] = copy.copy(self.task)
+        task_state = state["task"].__dict__.pop("state", None)
+        state["_task_state"] = (type(task_state), task_state.state_dict) if task_state is not None else None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        task_state = state.pop("_task_state", None)
+        super().__setstate__(state)
+        self._load_lock = threading.Lock()
+        if task_state is not None:
+            container_type, state_dict = task_state
+            self.task.state = container_type()
+            self.task.state.merge_state_dict(state_dict)
+
+    def save_snapshot(self, path: str, key: Dict[str, Any]):
+        """
+        Save the prepared (and possibly quantized) models together with the task, dictionaries, sentencepiece models
+        and vocabulary maps, so that the model can be restored with load_snapshot without rebuilding it from the
+        checkpoint.
+
+        :param key: values that identify the files and settings the model was loaded with
+        """
+        # make_generation_fast_ replaces the train method of the models with a local function that cannot be pickled
+        train_methods = [(model, model.__dict__.pop("train")) for model in self.models if "train" in model.__dict__]
+        # a unique temporary file, the snapshot may be saved by several workers that share the directory
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)),
+                                         prefix=f"{os.path.basename(path)}.", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+        try:
+            torch.save({"version": SNAPSHOT_VERSION, "key": key, "hub": self}, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            for model, train in train_methods:
+                model.train = train
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def load_snapshot(path: str, key: Dict[str, Any]) -> Optional["ModularHubInterface"]:
+        """
+        Load a model saved with save_snapshot. The tensors are loaded on the CPU.
+
+        :return: None if the snapshot does not exist or was saved with a different key or snapshot version
+        """
+        if not os.path.isfile(path):
+            return None
+        snapshot = torch.load(path, map_location="cpu", weights_only=False)
+        if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("key") != key:
+            logger.info(f"Model snapshot {path} is outdated.")
+            return None
+        return snapshot["hub"]
+
+    def has_language_pair(self, src_lang: str, tgt_lang: str) -> bool:
+        return all(f"{src_lang}-{tgt_lang}" in model.models for model in self.models)
+
+    def load_language_pair(self, src_lang: str, tgt_lang: str):
+        """
+        Load a language pair that was not included when the model was loaded. The encoder of each language is shared
+        by all of its language pairs in a MultilingualTransformerModel and the same holds for decoders, so if the
+        encoder and decoder of the pair are already in memory, the pair is built from them. Otherwise the checkpoint
+        is read again and the missing modules are loaded from it.
+        """
+        if self._source is None:
+            raise KeyError(f"Language pair {src_lang}-{tgt_lang} is not loaded.")
+        if self.checkpoint_language_pairs is not None and (src_lang, tgt_lang) not in self.checkpoint_language_pairs:
+            raise KeyError(f"Language pair {src_lang}-{tgt_lang} is not supported by the model.")
+
+        with self._load_lock:
+            if self.has_language_pair(src_lang, tgt_lang):
+                return
+
+            key = f"{src_lang}-{tgt_lang}"
+            modules = [(self._loaded_module(model, src_lang, "encoder"),
+                        self._loaded_module(model, tgt_lang, "decoder")) for model in self.models]
+            if all(encoder is not None and decoder is not None for encoder, decoder in modules):
+                logger.info(f"Language pair {key} built from the loaded encoder and decoder")
+                for model, (encoder, decoder) in zip(self.models, modules):
+                    model.models[key] = FairseqEncoderDecoderModel(encoder, decoder)
+                    model.keys.append(key)
+                self.max_positions = utils.resolve_max_positions(
+                    self.max_positions, *[model.max_positions() for model in self.models]
+                )
+                return
+
+            logger.info(f"Loading language pair {key}")
+            x, sp_models = self._load(**self._source, language_pairs=[(src_lang, tgt_lang)])
+            for model, new_model, (encoder, decoder) in zip(self.models, x["models"], modules):
+                new_model.prepare_for_inference_(self.cfg)
+                new_model.to(self.device)
+                if self.quantized:
+                    self._quantize_model(new_model)
+                pair_model = new_model.models[key]
+                model.models[key] = FairseqEncoderDecoderModel(encoder or pair_model.encoder,
+                                                               decoder or pair_model.decoder)
+                model.keys.append(key)
+
+            for lang in (src_lang, tgt_lang):
+                self.dicts.setdefault(lang, x["task"].dicts[lang])
+                self.sp_models.setdefault(lang, sp_models[lang])
+                if lang not in self._piece_indices:
+                    self._build_vocabulary_maps(lang)
+                if lang not in self.langs:
+                    self.langs.append(lang)
+
+            self.max_positions = utils.resolve_max_positions(
+                self.max_positions, *[model.max_positions() for model in x["models"]]
+            )
+
+    @staticmethod
+    def _loaded_module(model: MultilingualTransformerModel, language: str, kind: str) -> Optional[Module]:
+        """
+        Return the loaded encoder or decoder of a language, which is shared by all of its language pairs.
+        """
+        side = 0 if kind == "encoder" else 1
+        for key, pair_model in model.models.items():
+            if key.split("-")[side] == language:
+                return getattr(pair_model, kind)
+        return None
+
+    def _build_vocabulary_maps(self, language: str):
+        """
+        Build lookup tables between sentencepiece piece IDs and fairseq dictionary indices so that sentences can be
+        binarized and decoded without converting the pieces to strings. Pieces missing from the dictionary map to the
+        unknown token, and dictionary symbols that are not sentencepiece pieces map to -1.
+        """
+        sp_model = self.sp_models[language]
+        dictionary = self.dicts[language]
+        piece_indices = []
+        sentencepiece_ids = [-1] * len(dictionary)
+        for piece_id in range(sp_model.get_piece_size()):
+            index = dictionary.indices.get(sp_model.id_to_piece(piece_id), dictionary.unk())
+            piece_indices.append(index)
+            if index != dictionary.unk() and not sp_model.is_control(piece_id):
+                sentencepiece_ids[index] = piece_id
+        self._piece_indices[language] = torch.tensor(piece_indices, dtype=torch.long)
+        self._sentencepiece_ids[language] = sentencepiece_ids
+
+    def quantize(self):
+        """
+        Apply dynamic int8 quantization for CPU inference.
+        """
+        for model in self.models:
+            self._quantize_model(model)
+        self.quantized = True
+
+    @staticmethod
+    def _quantize_model(model: Module):
+        """
+        Quantize the linear layers of a model except attention projections, as fairseq passes their weights directly
+        to the fused attention implementation, which does not accept packed int8 weights.
+        """
+        attention_layers = {id(layer) for module in model.modules() if isinstance(module, MultiheadAttention)
+                            for layer in module.modules() if isinstance(layer, Linear)}
+        layer_names = {name for name, module in model.named_modules()
+                       if isinstance(module, Linear) and id(module) not in attention_layers}
+        torch.quantization.quantize_dynamic(model, qconfig_spec=layer_names, dtype=torch.qint8, inplace=True)
+
+    def use_torchscript(self, directory: str):
+        """
+        Use sequence generators that were exported to TorchScript with nmt_worker.export instead of the Python
+        implementation. All generators are loaded from a single file, where each encoder and decoder is stored once and
+        shared by the generators of all language pairs and generation settings that use it. Generation settings that
+        were not exported fall back to the Python generators.
+        """
+        self.scripted_generators = torch.jit.load(os.path.join(directory, TORCHSCRIPT_FILE),
+                                                  map_location=self.device).eval()
+        self._generators.clear()
 
     @property
     def device(self):
@@ -80,9 +367,25 @@ class ModularHubInterface(Module):
     def binarize(self, sentence: str, language: str) -> LongTensor:
         return self.dicts[language].encode_line(sentence, add_if_not_exist=False).long()
 
+    def binarize_ids(self, piece_ids: List[List[int]], language: str) -> List[LongTensor]:
+        """
+        Map the sentencepiece IDs of a batch of sentences to dictionary indices in a single lookup, equivalent to
+        calling binarize with the corresponding pieces.
+        """
+        if not piece_ids:
+            return []
+        tokens = self._piece_indices[language][torch.tensor(list(itertools.chain.from_iterable(piece_ids)),
+                                                            dtype=torch.long)]
+        eos = torch.tensor([self.dicts[language].eos()], dtype=torch.long)
+        return [torch.cat((sentence_tokens, eos)) for sentence_tokens in
+                torch.split(tokens, [len(ids) for ids in piece_ids])]
+
     def apply_bpe(self, sentence: str, language: str) -> str:
         return " ".join(self.sp_models[language].encode(sentence, out_type=str))
 
+    def count_tokens(self, sentence: str, language: str) -> int:
+        return len(self.sp_models[language].encode(sentence))
+
     def string(self, tokens: Tensor, language: str) -> str:
         return self.dicts[language].string(tokens)
 
@@ -92,13 +395,24 @@ class ModularHubInterface(Module):
 
     def encode(self, sentence: str, language: str) -> LongTensor:
         bpe_token_sent = self.apply_bpe(sentence, language)
-        logger.info(f"Preprocessed: {sentence} into {bpe_token_sent}.")
+        logger.debug("Preprocessed: %s into %s.", sentence, bpe_token_sent)
         return self.binarize(bpe_token_sent, language)
 
     def decode(self, tokens: Tensor, language: str) -> str:
+        """
+        Decode the dictionary indices directly with sentencepiece. Translations with unknown tokens or symbols that
+        are not sentencepiece pieces are decoded from the dictionary strings instead.
+        """
+        dictionary = self.dicts[language]
+        sentencepiece_ids = self._sentencepiece_ids[language]
+        special = {dictionary.eos(), dictionary.bos()}
+        piece_ids = [sentencepiece_ids[index] for index in tokens.tolist() if index not in special]
+        if -1 not in piece_ids:
+            return self.sp_models[language].decode(piece_ids).strip()
+
         bpe_token_sent = self.string(tokens, language)
         decoded_sent = self.remove_bpe(bpe_token_sent)
-        logger.info(f"Postprocessed: {bpe_token_sent} into {decoded_sent}.")
+        logger.debug("Postprocessed: %s into %s.", bpe_token_sent, decoded_sent)
         return decoded_sent
 
     def translate(
@@ -107,29 +421,55 @@ class ModularHubInterface(Module):
             src_language: str,
             tgt_language: str,
             beam: int = 5,
+            max_len_a: Optional[float] = None,
+            max_len_b: Optional[int] = None,
             max_sentences: Optional[int] = 10,
             max_tokens: Optional[int] = 1000,
+            timings: Optional[Timings] = None,
     ) -> List[str]:
         """
         :param sentences: list of sentences to be translated
         :param src_language: source language
         :param tgt_language: target language
         :param beam: beam size for the beam search algorithm (decoding)
+        :param max_len_a: generate sequences of maximum length ax + b, where x is the source length, the values from
+        the model configuration are used by default
+        :param max_len_b: see max_len_a
         :param max_sentences: max number of sentences in each batch
         :param max_tokens: max number of tokens in each batch, all sentences must be shorter than max_tokens.
+        :param timings: an optional object to record the duration of each step and the number of tokens
         :return: list of translations corresponding to the input sentences
         """
+        timings = timings if timings is not None else Timings()
         logger.info(f"Translating from {src_language} to {tgt_language}")
-        tokenized_sentences = [self.encode(sentence, src_language) for sentence in sentences]
-        batched_hypos = self._generate(
-            tokenized_sentences,
-            src_language,
-            tgt_language,
-            beam=beam,
-            max_sentences=max_sentences,
-            max_tokens=max_tokens
-        )
-        return [self.decode(hypos[0]["tokens"], tgt_language) for hypos in batched_hypos]
+        if not self.has_language_pair(src_language, tgt_language):
+            self.load_language_pair(src_language, tgt_language)
+
+        with timings.measure('sentencepiece'):
+            piece_ids = self.sp_models[src_language].encode(sentences)
+        if logger.isEnabledFor(logging.DEBUG):
+            for sentence, ids in zip(sentences, piece_ids):
+                logger.debug("Preprocessed: %s into %s.", sentence,
+                             " ".join(self.sp_models[src_language].id_to_piece(ids)))
+        with timings.measure('binarize'):
+            tokenized_sentences = self.binarize_ids(piece_ids, src_language)
+        timings.count('source_tokens', sum(tokens.numel() for tokens in tokenized_sentences))
+
+        with timings.measure('generate'), torch.inference_mode():
+            batched_hypos = self._generate(
+                tokenized_sentences,
+                src_language,
+                tgt_language,
+                beam=beam,
+                max_len_a=max_len_a,
+                max_len_b=max_len_b,
+                max_sentences=max_sentences,
+                max_tokens=max_tokens
+            )
+        timings.count('target_tokens', sum(hypos[0]["tokens"].numel() for hypos in batched_hypos))
+
+        with timings.measure('decode'):
+            return [self.decode(hypos[0]["tokens"], tgt_language) for hypos in batched_hypos]
 
     def _generate(
             self,
@@ -137,14 +477,13 @@ class ModularHubInterface(Module):
             src_lang: str,
             tgt_lang: str,
             beam: int = 5,
+            max_len_a: Optional[float] = None,
+            max_len_b: Optional[int] = None,
             max_sentences: Optional[int] = 10,
             max_tokens: Optional[int] = None,
             skip_invalid_size_inputs=False,
     ) -> List[List[Dict[str, Tensor]]]:
-        gen_args = copy.deepcopy(self.cfg.generation)
-        with open_dict(gen_args):
-            gen_args.beam = beam
-        generator = self._build_generator(src_lang, tgt_lang, gen_args)
+        generator = self.get_generator(src_lang, tgt_lang, beam, max_len_a, max_len_b)
 
         results = []
         for batch in self._build_batches(
@@ -156,9 +495,14 @@ class ModularHubInterface(Module):
                 max_tokens=max_tokens
         ):
             batch = utils.apply_to_sample(lambda t: t.to(self.device), batch)
-            translations = self.task.inference_step(
-                generator, self.models, batch
-            )
+            with batch_turn():
+                if isinstance(generator, ScriptModule):
+                    net_input = {key: batch["net_input"][key] for key in ("src_tokens", "src_lengths")}
+                    translations = generator({"net_input": net_input}, bos_token=self._bos_token(tgt_lang))
+                else:
+                    translations = self.task.inference_step(
+                        generator, self.models, batch
+                    )
             for id, hypos in zip(batch["id"].tolist(), translations):
                 results.append((id, hypos))
 
@@ -193,19 +537,66 @@ class ModularHubInterface(Module):
             max_tokens: Optional[int] = None
     ) -> Iterator[Dict[str, Any]]:
         lengths = LongTensor([t.numel() for t in tokens])
-        batch_iterator = self.task.get_batch_iterator(
-            dataset=self._build_dataset_for_inference(tokens, lengths, src_lang, tgt_lang),
-            max_tokens=max_tokens,
-            max_sentences=max_sentences,
-            max_positions=self.max_positions[f"{src_lang}-{tgt_lang}"],
-            ignore_invalid_inputs=skip_invalid_size_inputs,
-            disable_iterator_cache=True,
-        ).next_epoch_itr(shuffle=False)
-        return batch_iterator
-
-    def _build_generator(self, src_lang, tgt_lang, args):
+        dataset = self._build_dataset_for_inference(tokens, lengths, src_lang, tgt_lang)
+        max_source_positions = self.max_positions[f"{src_lang}-{tgt_lang}"][0]
+
+        valid = []
+        for idx in range(len(dataset)):
+            if dataset.size(idx)[0] <= max_source_positions:
+                valid.append(idx)
+            elif not skip_invalid_size_inputs:
+                raise ValueError(f"Sentence #{idx} has {dataset.size(idx)[0]} tokens, which exceeds the limit of "
+                                 f"{max_source_positions} tokens.")
+
+        scheduler = BatchScheduler(max_sentences=max_sentences or len(valid) or 1,
+                                   max_tokens=max_tokens or max_source_positions * len(valid) or 1)
+        for batch in scheduler.plan([dataset.num_tokens(idx) for idx in valid]):
+            yield dataset.collater([dataset[valid[idx]] for idx in batch])
+
+    def _bos_token(self, tgt_lang: str) -> int:
+        # the same initial decoder token as MultilingualTranslationTask.inference_step
+        if getattr(self.task.args, "decoder_langtok", False):
+            return _lang_token_index(self.dicts[tgt_lang], tgt_lang)
+        return self.dicts[tgt_lang].eos()
+
+    def get_generator(self, src_lang: str, tgt_lang: str, beam: int = 5, max_len_a: Optional[float] = None,
+                      max_len_b: Optional[int] = None) -> Union[SequenceGenerator, ScriptModule]:
+        """
+        Return a sequence generator for the language pair and generation settings. Generators are built or loaded
+        from the TorchScript directory on first use and reused in subsequent calls.
+        """
+        key = (src_lang, tgt_lang, beam, max_len_a, max_len_b)
+        if key not in self._generators and self.scripted_generators is not None:
+            name = torchscript_generator_name(*key)
+            if hasattr(self.scripted_generators.generators, name):
+                self._generators[key] = getattr(self.scripted_generators.generators, name)
+            else:
+                logger.warning(f"TorchScript generator {name} was not exported, using the Python implementation.")
+        if key not in self._generators:
+            self._generators[key] = self.build_generator(*key)
+        return self._generators[key]
+
+    def build_generator(self, src_lang: str, tgt_lang: str, beam: int = 5, max_len_a: Optional[float] = None,
+                        max_len_b: Optional[int] = None, models: Optional[List[Module]] = None) -> SequenceGenerator:
+        """
+        Build a new sequence generator for the language pair and generation settings.
+
+        :param models: the models used by the generator, the models of the language pair by default
+        """
+        gen_args = copy.deepcopy(self.cfg.generation)
+        with open_dict(gen_args):
+            gen_args.beam = beam
+            if max_len_a is not None:
+                gen_args.max_len_a = max_len_a
+            if max_len_b is not None:
+                gen_args.max_len_b = max_len_b
+        if models is None:
+            models = [model.models[f"{src_lang}-{tgt_lang}"] for model in self.models]
+        return self._build_generator(models, tgt_lang, gen_args)
+
+    def _build_generator(self, models, tgt_lang, args):
         return SequenceGenerator(
-            ModuleList([model.models[f"{src_lang}-{tgt_lang}"] for model in self.models]),
+            ModuleList(models),
             self.dicts[tgt_lang],
             beam_size=getattr(args, "beam", 5),
             max_len_a=getattr(args, "max_len_a", 0),
@@ -219,3 +610,11 @@ class ModularHubInterface(Module):
             no_repeat_ngram_size=getattr(args, "no_repeat_ngram_size", 0),
             search_strategy=search.BeamSearch(self.dicts[tgt_lang]),
         )
+
+
+def torchscript_generator_name(src_lang: str, tgt_lang: str, beam: int = 5, max_len_a: Optional[float] = None,
+                               max_len_b: Optional[int] = None) -> str:
+    """
+    The name of an exported sequence generator for a language pair and generation settings.
+    """
+    return f"{src_lang}_{tgt_lang}_beam{beam}_a{max_len_a}_b{max_len_b}".replace(".", "_").replace("-", "_")
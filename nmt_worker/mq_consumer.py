@@ -1,8 +1,10 @@
 import json
 import logging
 import hashlib
+import functools
 from sys import getsizeof
-from time import time, sleep
+from time import sleep
+from typing import List, Tuple, Union, Dict, Any, Optional, Callable, TypeVar
 
 from pydantic import ValidationError
 
@@ -10,17 +12,24 @@ import pika
 import pika.exceptions
 from pika import credentials, BlockingConnection, ConnectionParameters
 
+from nmt_worker import readiness
 from nmt_worker.schemas import Response, Request
-from nmt_worker.translator import Translator
+from nmt_worker.translator import Translator, PreparedRequest
+from nmt_worker.multi_model import MultiModelTranslator
 from nmt_worker.config import MQConfig
+from nmt_worker.batching import MicroBatcher, PendingBatch
+from nmt_worker.priority import PriorityGate, request_priority
+from nmt_worker.instrumentation import Timings, BATCH_FILL, PENDING_MESSAGES, PREFETCH_COUNT
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar('T')
+
 X_EXPIRES = 60000
 
 
 class MQConsumer:
-    def __init__(self, translator: Translator, mq_config: MQConfig):
+    def __init__(self, translator: Union[Translator, MultiModelTranslator], mq_config: MQConfig):
         """
         Initializes a RabbitMQ consumer class that listens for requests for a specific worker and responds to
         them.
@@ -29,7 +38,16 @@ class MQConsumer:
         self.translator = translator
         self.routing_keys = []
         self.queue_name = None
+        self.connection = None
         self.channel = None
+        self.batcher = None
+        # requests are translated one at a time, so there are no concurrent batches to reorder, see AsyncMQConsumer
+        self.gate: Optional[PriorityGate] = None
+
+        if self.mq_config.prefetch_count > 1:
+            self.batcher = MicroBatcher(max_sentences=self.mq_config.batch_max_sentences,
+                                        max_tokens=self.mq_config.batch_max_tokens,
+                                        max_wait=self.mq_config.batch_max_wait)
 
         self._generate_queue_config()
 
@@ -38,15 +56,20 @@ class MQConsumer:
         Produce routing keys with the following format: exchange_name.src.tgt.domain
         """
         routing_keys = []
-        for domain in self.translator.model_config.domains:
-            for language_pair in domain.language_pairs:
-                source, target = language_pair.split('-')
-                key = f'{self.mq_config.exchange}.{source}.{target}.{domain.name}'
-                routing_keys.append(key)
-        self.routing_keys = sorted(routing_keys)
-        hashed = hashlib.sha256(str(self.routing_keys).encode('utf-8')).hexdigest()[:8]
-        self.queue_name = \
-            f'{self.mq_config.exchange}.{self.translator.model_config.model_name}_{hashed}'
+        for model_config in self.translator.model_configs:
+            for domain in model_config.domains:
+                for language_pair in domain.language_pairs:
+                    source, target = language_pair.split('-')
+                    key = f'{self.mq_config.exchange}.{source}.{target}.{domain.name}'
+                    routing_keys.append(key)
+        self.routing_keys = sorted(set(routing_keys))
+        queue_config = str(self.routing_keys)
+        if self.mq_config.max_priority:
+            # the arguments of an existing queue cannot be changed, so a priority queue gets a different name
+            queue_config += f'x-max-priority={self.mq_config.max_priority}'
+        hashed = hashlib.sha256(queue_config.encode('utf-8')).hexdigest()[:8]
+        model_names = '+'.join(model_config.model_name for model_config in self.translator.model_configs)
+        self.queue_name = f'{self.mq_config.exchange}.{model_names}_{hashed}'
 
     def start(self):
         """
@@ -56,9 +79,10 @@ class MQConsumer:
         while True:
             try:
                 self._connect()
-                logger.info('Ready to process requests.')
+                readiness.set_ready()
                 self.channel.start_consuming()
             except pika.exceptions.AMQPConnectionError as e:
+                readiness.set_not_ready()
                 logger.error(e)
                 logger.info('Trying to reconnect in 5 seconds.')
                 sleep(5)
@@ -67,13 +91,8 @@ class MQConsumer:
                 self.channel.close()
                 break
 
-    def _connect(self):
-        """
-        Connects to RabbitMQ, (re)declares the exchange for the service and a queue for the worker binding
-        any alternative routing keys as needed.
-        """
-        logger.info(f'Connecting to RabbitMQ server: {{host: {self.mq_config.host}, port: {self.mq_config.port}}}')
-        connection = BlockingConnection(ConnectionParameters(
+    def _connection_parameters(self) -> ConnectionParameters:
+        return ConnectionParameters(
             host=self.mq_config.host,
             port=self.mq_config.port,
             credentials=credentials.PlainCredentials(
@@ -84,22 +103,47 @@ class MQConsumer:
             client_properties={
                 'connection_name': self.mq_config.connection_name
             }
-        ))
-        self.channel = connection.channel()
-        self.channel.queue_declare(queue=self.queue_name, arguments={
-            'x-expires': X_EXPIRES
-        })
+        )
+
+    def _connect(self):
+        """
+        Connects to RabbitMQ, (re)declares the exchange for the service and a queue for the worker binding
+        any alternative routing keys as needed.
+        """
+        logger.info(f'Connecting to RabbitMQ server: {{host: {self.mq_config.host}, port: {self.mq_config.port}}}')
+        self.connection = BlockingConnection(self._connection_parameters())
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue=self.queue_name, arguments=self._queue_arguments())
         self.channel.exchange_declare(exchange=self.mq_config.exchange, exchange_type='direct')
 
         for route in self.routing_keys:
             self.channel.queue_bind(exchange=self.mq_config.exchange, queue=self.queue_name,
                                     routing_key=route)
 
-        self.channel.basic_qos(prefetch_count=1)
-        self.channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_request)
+        self.channel.basic_qos(prefetch_count=self.mq_config.prefetch_count)
+        PREFETCH_COUNT.set(self.mq_config.prefetch_count)
+        if self.batcher:
+            self.batcher.pop_all()  # unacknowledged messages are redelivered after reconnecting
+            self.channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_batched_request)
+        else:
+            self.channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_request)
+
+    def _queue_arguments(self) -> Dict[str, Any]:
+        arguments = {'x-expires': X_EXPIRES}
+        if self.mq_config.max_priority:
+            arguments['x-max-priority'] = self.mq_config.max_priority
+        return arguments
+
+    def _priority(self, properties: pika.BasicProperties, request: Request) -> int:
+        """
+        The priority of a request is given by the message property or by the application that sent the request.
+        """
+        if properties.priority is not None:
+            return properties.priority
+        return self.mq_config.application_priorities.get(request.application, 0)
 
     @staticmethod
-    def _respond(channel: pika.adapters.blocking_connection.BlockingChannel, method: pika.spec.Basic.Deliver,
+    def _respond(channel: pika.channel.Channel, method: pika.spec.Basic.Deliver,
                  properties: pika.BasicProperties, body: bytes):
         """
         Publish the response to the callback queue and acknowledge the original queue item.
@@ -112,28 +156,124 @@ class MQConsumer:
                               body=body)
         channel.basic_ack(delivery_tag=method.delivery_tag)
 
-    def _on_request(self, channel: pika.adapters.blocking_connection.BlockingChannel, method: pika.spec.Basic.Deliver,
-                    properties: pika.BasicProperties, body: bytes):
+    @staticmethod
+    def _encode(properties: pika.BasicProperties, response: Response, timings: Timings) -> bytes:
+        with timings.measure('encode_response'):
+            body = response.encode()
+        timings.record('encode_response')
+        logger.info(f"Request processed: {{id: {properties.correlation_id}, duration: {round(timings.elapsed(), 3)} s, "
+                    f"size: {getsizeof(body)} bytes}}")
+        logger.debug(f"Request timings: {{id: {properties.correlation_id}, stages: {timings}}}")
+        return body
+
+    @staticmethod
+    def _internal_error(error: Exception) -> Response:
         """
-        Pass the request to the worker and return its response.
+        Log an unexpected error with its traceback and return the response sent in its place.
+        """
+        logger.exception(f'Unexpected error: {error}')
+        return Response(status_code=500, status="Unknown internal error.")
+
+    def _handle(self, body: bytes, timings: Timings, handler: Callable[[Request], T]) -> Union[T, Response]:
+        """
+        Parse a request and pass it to the handler. Returns an error response if the request is invalid or the
+        handler fails.
         """
-        t1 = time()
-        logger.info(f"Received request: {{id: {properties.correlation_id}, size: {getsizeof(body)} bytes}}")
         try:
-            request = json.loads(body)
-            request = Request(**request)
-            response = self.translator.process_request(request)
+            with timings.measure('parse'):
+                request = json.loads(body)
+                request = Request(**request)
+            return handler(request)
         except ValidationError as error:
-            response = Response(status=f'Error parsing input: {str(error)}', status_code=400)
+            return Response(status=f'Error parsing input: {str(error)}', status_code=400)
         except Exception as e:
-            logger.exception(f'Unexpected error: {e}')
-            response = Response(status_code=500, status="Unknown internal error.")
+            return self._internal_error(e)
 
-        response = response.encode()
-        response_size = getsizeof(response)
+    def _process(self, properties: pika.BasicProperties, body: bytes, timings: Timings) -> bytes:
+        """
+        Parse and translate a request and return the encoded response.
+        """
+        response = self._handle(body, timings, lambda request: self.translator.process_request(request, timings))
+        return self._encode(properties, response, timings)
+
+    def _prepare(self, properties: pika.BasicProperties, body: bytes,
+                 timings: Timings) -> Union[PreparedRequest, bytes]:
+        """
+        Parse and preprocess a request to be translated as a part of a batch. Returns the encoded error response if
+        this fails.
+        """
+        prepared = self._handle(body, timings, lambda request: self.translator.prepare_request(request, timings))
+        if isinstance(prepared, Response):
+            return self._encode(properties, prepared, timings)
+        return prepared
+
+    def _add_to_batch(self, method: pika.spec.Basic.Deliver, properties: pika.BasicProperties,
+                      prepared: PreparedRequest) -> Tuple[PendingBatch, bool]:
+        batch, created = self.batcher.add(prepared.batch_key, (method, properties, prepared),
+                                          sentences=prepared.n_sentences, tokens=prepared.n_tokens)
+        PENDING_MESSAGES.set(self.batcher.n_pending)
+        return batch, created
+
+    def _pop_batch(self, batch: PendingBatch) -> bool:
+        """
+        Remove the batch from pending batches. Returns False if it has already been processed.
+        """
+        if self.batcher.pop(batch) is None:
+            return False
+        PENDING_MESSAGES.set(self.batcher.n_pending)
+        BATCH_FILL.observe(min(1.0, max(batch.sentences / self.batcher.max_sentences,
+                                        batch.tokens / self.batcher.max_tokens)))
+        return True
+
+    def _process_batch(self, batch: PendingBatch) -> List[bytes]:
+        """
+        Translate all requests in a batch and return the encoded responses.
+        """
+        logger.info(f"Processing a batch: {{requests: {len(batch)}, sentences: {batch.sentences}, "
+                    f"tokens: {batch.tokens}}}")
+        priority = max(self._priority(properties, prepared.request) for _, properties, prepared in batch.items)
+        try:
+            with request_priority(self.gate, priority):
+                responses = self.translator.process_prepared([prepared for _, _, prepared in batch.items])
+        except Exception as e:
+            responses = [self._internal_error(e)] * len(batch.items)
+
+        return [self._encode(properties, response, prepared.timings)
+                for (_, properties, prepared), response in zip(batch.items, responses)]
 
+    def _on_request(self, channel: pika.adapters.blocking_connection.BlockingChannel, method: pika.spec.Basic.Deliver,
+                    properties: pika.BasicProperties, body: bytes):
+        """
+        Pass the request to the worker and return its response.
+        """
+        logger.info(f"Received request: {{id: {properties.correlation_id}, size: {getsizeof(body)} bytes}}")
+        response = self._process(properties, body, Timings())
         self._respond(channel, method, properties, response)
-        t2 = time()
 
-        logger.info(f"Request processed: {{id: {properties.correlation_id}, duration: {round(t2 - t1, 3)} s, "
-                    f"size: {response_size} bytes}}")
+    def _on_batched_request(self, channel: pika.adapters.blocking_connection.BlockingChannel,
+                            method: pika.spec.Basic.Deliver, properties: pika.BasicProperties, body: bytes):
+        """
+        Preprocess the request and add it to a pending batch with the same language pair. The batch is translated
+        once it reaches its size limits or when the max wait time has passed.
+        """
+        logger.info(f"Received request: {{id: {properties.correlation_id}, size: {getsizeof(body)} bytes}}")
+        prepared = self._prepare(properties, body, Timings())
+        if isinstance(prepared, bytes):
+            self._respond(channel, method, properties, prepared)
+            return
+
+        batch, created = self._add_to_batch(method, properties, prepared)
+        if self.batcher.is_full(batch):
+            self._flush(channel, batch)
+        elif created:
+            self.connection.call_later(self.batcher.max_wait, functools.partial(self._flush, channel, batch))
+
+    def _flush(self, channel: pika.adapters.blocking_connection.BlockingChannel, batch: PendingBatch):
+        """
+        Translate a pending batch and respond to all requests in it.
+        """
+        if not self._pop_batch(batch):
+            return
+
+        for (method, properties, _), response in zip(batch.items, self._process_batch(batch)):
+            self._respond(channel, method, properties, response)
@@ -0,0 +1,150 @@
+import gc
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import List, Dict, Tuple, Optional
+
+import torch
+
+from .config import ModelConfig
+from .schemas import Request, Response
+from .translator import Translator, PreparedRequest
+from .instrumentation import Timings, LOADED_MODELS
+
+logger = logging.getLogger(__name__)
+
+
+class MultiModelTranslator:
+    pipeline = None
+    warmed_up = False  # models that are loaded on demand after warmup are warmed up before their first request
+
+    def __init__(self, model_configs: List[ModelConfig], max_loaded_models: Optional[int] = None):
+        """
+        Serves several models in a single worker. Requests are dispatched to a model by their language pair and
+        domain. At most max_loaded_models models are kept in memory at once, the least recently used model is
+        unloaded when another one needs to be loaded. Dictionaries and sentencepiece models with identical files
+        are shared between the loaded models.
+
+        :param max_loaded_models: all models are kept loaded by default
+        """
+        self.model_configs = model_configs
+        self.max_loaded_models = max_loaded_models or len(model_configs)
+        self.translators: Dict[str, Translator] = OrderedDict()
+        self.routes = self._build_routes()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._loading = 0
+
+        for model_config in model_configs[:self.max_loaded_models]:
+            self.get_translator(model_config.model_name)
+
+    def _build_routes(self) -> Dict[Tuple[str, str, Optional[str]], str]:
+        """
+        Map language pairs and domains to model names. Requests without a domain are sent to the first model that
+        supports the language pair.
+        """
+        routes = {}
+        for model_config in self.model_configs:
+            for domain in model_config.domains:
+                for language_pair in domain.language_pairs:
+                    source, target = language_pair.split('-')
+                    if (source, target, domain.name) in routes:
+                        raise ValueError(f"Language pair {language_pair} of domain {domain.name} is served by both "
+                                         f"{routes[(source, target, domain.name)]} and {model_config.model_name}.")
+                    routes[(source, target, domain.name)] = model_config.model_name
+                    routes.setdefault((source, target, None), model_config.model_name)
+        return routes
+
+    def get_model_name(self, request: Request) -> str:
+        key = (request.src, request.tgt, request.domain)
+        if key not in self.routes:
+            key = (request.src, request.tgt, None)
+        return self.routes[key]
+
+    def get_translator(self, model_name: str) -> Translator:
+        """
+        Return the translator of a model, loading the model and unloading the least recently used one if needed.
+        Requests that are already being translated by an unloaded model keep a reference to it until they finish.
+        Models are loaded outside of the global lock, so that requests for loaded models are not blocked meanwhile.
+        """
+        with self._lock:
+            if model_name in self.translators:
+                self.translators.move_to_end(model_name)
+                return self.translators[model_name]
+            load_lock = self._load_locks[model_name]
+
+        with load_lock:
+            with self._lock:
+                if model_name in self.translators:  # loaded by another thread while waiting
+                    self.translators.move_to_end(model_name)
+                    return self.translators[model_name]
+                # unload models before loading a new one to keep memory use within max_loaded_models
+                unloaded = []
+                while self.translators and len(self.translators) + self._loading >= self.max_loaded_models:
+                    unloaded.append(self.translators.popitem(last=False))
+                self._loading += 1
+                LOADED_MODELS.set(len(self.translators))
+            self._unload(unloaded)
+
+            try:
+                model_config = next(config for config in self.model_configs if config.model_name == model_name)
+                logger.info(f"Loading model: {model_name}")
+                translator = Translator(model_config)
+                if self.warmed_up:
+                    translator.warmup()
+            finally:
+                with self._lock:
+                    self._loading -= 1
+
+            with self._lock:
+                self.translators[model_name] = translator
+                LOADED_MODELS.set(len(self.translators))
+            return translator
+
+    @staticmethod
+    def _unload(translators: List[Tuple[str, Translator]]):
+        if not translators:
+            return
+        for model_name, translator in translators:
+            translator.close()
+            logger.info(f"Model unloaded: {model_name}")
+        # drop the remaining references so that the models can be collected
+        translators.clear()
+        del translator
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def init_cache(self):
+        for translator in self.translators.values():
+            translator.init_cache()
+
+    def warmup(self):
+        for translator in list(self.translators.values()):
+            translator.warmup()
+        self.warmed_up = True
+
+    def share_memory(self):
+        for translator in self.translators.values():
+            translator.share_memory()
+
+    def process_request(self, request: Request, timings: Optional[Timings] = None) -> Response:
+        return self.get_translator(self.get_model_name(request)).process_request(request, timings)
+
+    def prepare_request(self, request: Request, timings: Optional[Timings] = None) -> PreparedRequest:
+        return self.get_translator(self.get_model_name(request)).prepare_request(request, timings)
+
+    def process_prepared(self, prepared: List[PreparedRequest]) -> List[Response]:
+        """
+        Translate preprocessed requests with their models, requests for the same model are translated together.
+        """
+        groups = defaultdict(list)
+        for idx, item in enumerate(prepared):
+            groups[item.model_name].append(idx)
+
+        responses = [None] * len(prepared)
+        for model_name, indices in groups.items():
+            translator = self.get_translator(model_name)
+            for idx, response in zip(indices, translator.process_prepared([prepared[idx] for idx in indices])):
+                responses[idx] = response
+        return responses
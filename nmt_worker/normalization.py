@@ -2,6 +2,7 @@
 Adapted from the Moses punctuation normalization script
 """
 import re
+from typing import Tuple
 
 # define and compile all the patterns
 REGEXES = (
@@ -34,7 +35,76 @@ REGEXES = (
 )
 
 
+# single character replacements that are applied before the context-dependent rules (whitespace and apostrophes)
+PRE_REPLACEMENTS = (
+    ('\xa0', ' '), ('\r', ''),
+    ('`', "'"), ('´', "'"), ('′', "'"), ('‘', "'"), ('‚', "'"), ('’', "'"),
+)
+# single character replacements that are applied after apostrophe pairs have been merged into quotation marks
+POST_REPLACEMENTS = (
+    ('„', '"'), ('“', '"'), ('”', '"'), ('«', '"'), ('»', '"'),
+    ('\xad', ''),
+    ('–', '-'), ('‐', '-'), ('‒', '-'), ('−', '-'),
+    ('…', '...'),
+)
+
+PARENTHESIS_PUNCTUATION = re.compile(r'\) ([.!:?;,])')
+PERCENT = re.compile(r'(\d) %')
+PUNCTUATION = re.compile(r' ([:;?!])')
+EM_DASH = re.compile(r' *— *')
+SPACES = re.compile(r'  +')
+
+
 def normalize(sentence: str):
+    """
+    Apply the same normalization as the REGEXES in order (see normalize_reference), but replace single characters
+    with string methods and skip the rules that cannot match the sentence.
+    """
+    sentence = _replace_characters(sentence, PRE_REPLACEMENTS)
+
+    if '(' in sentence:
+        sentence = _replace_with_spaces(sentence, '(', ' (')
+    if ')' in sentence:
+        sentence = _replace_with_spaces(sentence, ')', ') ')
+        sentence = PARENTHESIS_PUNCTUATION.sub(r')\1', sentence)
+    if ' %' in sentence:
+        sentence = PERCENT.sub(r'\1%', sentence)
+    if ' :' in sentence or ' ;' in sentence or ' ?' in sentence or ' !' in sentence:
+        sentence = PUNCTUATION.sub(r'\1', sentence)
+
+    if "''" in sentence:
+        sentence = sentence.replace("''", '"')
+    sentence = _replace_characters(sentence, POST_REPLACEMENTS)
+    if '—' in sentence:
+        sentence = EM_DASH.sub(' - ', sentence)
+
+    if '  ' in sentence:
+        sentence = SPACES.sub(' ', sentence)
+    return sentence
+
+
+def _replace_characters(sentence: str, replacements: Tuple[Tuple[str, str], ...]) -> str:
+    for char, replacement in replacements:
+        if char in sentence:
+            sentence = sentence.replace(char, replacement)
+    return sentence
+
+
+def _replace_with_spaces(sentence: str, char: str, replacement: str) -> str:
+    """
+    Replace the character and any spaces around it, equivalent to re.sub(rf' *{char} *', replacement, sentence).
+    """
+    pieces = sentence.split(char)
+    pieces[0] = pieces[0].rstrip(' ')
+    pieces[1:-1] = [piece.strip(' ') for piece in pieces[1:-1]]
+    pieces[-1] = pieces[-1].lstrip(' ')
+    return replacement.join(pieces)
+
+
+def normalize_reference(sentence: str):
+    """
+    The reference implementation that applies all REGEXES one by one.
+    """
     for regex, sub in REGEXES:
         sentence = regex.sub(sub, sentence)
     return sentence
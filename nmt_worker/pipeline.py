@@ -0,0 +1,77 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+P = TypeVar('P')
+R = TypeVar('R')
+F = TypeVar('F')
+
+
+class Pipeline:
+    def __init__(self, threads: int = 2, queue_size: int = 2):
+        """
+        Runs the text preprocessing and postprocessing of consecutive chunks of work in a small thread pool while the
+        calling thread translates the current chunk, so that the Python text processing overlaps with inference.
+
+        :param threads: the number of preprocessing and postprocessing threads
+        :param queue_size: the maximum number of chunks that are prepared ahead or waiting to be postprocessed
+        """
+        self.threads = threads
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='pipeline')
+        self._lock = threading.Lock()
+        self._running = 0
+        self._closed = False
+
+    def close(self):
+        """
+        Shut down the thread pool once the runs in progress have finished. Later runs process all items in the
+        calling thread.
+        """
+        with self._lock:
+            self._closed = True
+            if not self._running:
+                self.executor.shutdown(wait=False)
+
+    def run(self, items: Iterable[T], prepare: Callable[[T], P], process: Callable[[P], R],
+            finish: Callable[[R], F]) -> Iterator[F]:
+        """
+        Yield finish(process(prepare(item))) for each item in the original order. The items are prepared and finished
+        in the thread pool and processed in the calling thread.
+        """
+        with self._lock:
+            closed = self._closed
+            self._running += not closed
+        if closed:
+            for item in items:
+                yield finish(process(prepare(item)))
+            return
+
+        try:
+            yield from self._run(items, prepare, process, finish)
+        finally:
+            with self._lock:
+                self._running -= 1
+                if self._closed and not self._running:
+                    self.executor.shutdown(wait=False)
+
+    def _run(self, items: Iterable[T], prepare: Callable[[T], P], process: Callable[[P], R],
+             finish: Callable[[R], F]) -> Iterator[F]:
+        items = iter(items)
+        prepared = deque(self.executor.submit(prepare, item) for _, item in zip(range(self.queue_size), items))
+        finishing = deque()
+        while prepared:
+            current = prepared.popleft().result()
+            for item in items:
+                prepared.append(self.executor.submit(prepare, item))
+                break
+            finishing.append(self.executor.submit(finish, process(current)))
+            while finishing and (len(finishing) > self.queue_size or finishing[0].done()):
+                yield finishing.popleft().result()
+        while finishing:
+            yield finishing.popleft().result()
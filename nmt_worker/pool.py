@@ -0,0 +1,100 @@
+import os
+import sys
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+from multiprocessing.sharedctypes import Synchronized
+from typing import Optional, Type, Union, List
+
+import torch
+
+from nmt_worker import readiness
+from nmt_worker.config import MQConfig
+from nmt_worker.translator import Translator
+from nmt_worker.multi_model import MultiModelTranslator
+from nmt_worker.mq_consumer import MQConsumer
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_TIMEOUT = 10
+READINESS_INTERVAL = 1
+MAX_RESTARTS = 3  # restarts of a worker that keeps failing before it becomes ready
+
+
+def _run_consumer(translator: Union[Translator, MultiModelTranslator], mq_config: MQConfig, threads: Optional[int],
+                  metrics_port: Optional[int], consumer_class: Type[MQConsumer], ready_flag: Synchronized):
+    readiness.configure_worker(ready_flag)
+    if threads:
+        torch.set_num_threads(threads)
+    translator.init_cache()
+    if metrics_port:
+        from nmt_worker.metrics import start_metrics_server
+        start_metrics_server(metrics_port)
+    translator.warmup()
+
+    logger.info(f"Worker process started: {{pid: {os.getpid()}, threads: {torch.get_num_threads()}}}")
+    consumer = consumer_class(translator=translator, mq_config=mq_config)
+    consumer.start()
+
+
+def run_worker_pool(translator: Union[Translator, MultiModelTranslator], mq_config: MQConfig, workers: int,
+                    threads: Optional[int] = None, metrics_port: Optional[int] = None,
+                    consumer_class: Type[MQConsumer] = MQConsumer):
+    """
+    Start several worker processes that consume requests from the same queue. The model is loaded once by the parent
+    process and its tensors are moved to shared memory before forking so that all workers use the same copy of the
+    weights. Each worker is warmed up before it starts consuming. If a metrics port is given, each worker exports its
+    metrics on a separate port starting from it. The parent process is ready (and creates the ready file) while all
+    workers are ready. Workers that exit with an error are restarted, unless a worker keeps failing before it becomes
+    ready, in which case all workers are stopped and the process exits with an error.
+    """
+    translator.share_memory()
+    if any(model_config.lazy_loading for model_config in translator.model_configs):
+        logger.warning("Language pairs that are loaded lazily after the worker processes are started are loaded "
+                       "separately by each worker instead of being shared.")
+    context = multiprocessing.get_context('fork')
+
+    ready_flags = [context.Value('b', 0) for _ in range(workers)]
+
+    def start_worker(idx: int) -> multiprocessing.Process:
+        process = context.Process(
+            target=_run_consumer,
+            args=(translator, mq_config, threads, metrics_port + idx if metrics_port else None, consumer_class,
+                  ready_flags[idx]),
+            name=f'nmt-worker-{idx}'
+        )
+        process.start()
+        return process
+
+    processes: List[Optional[multiprocessing.Process]] = [start_worker(idx) for idx in range(workers)]
+    failures = [0] * workers  # consecutive failures of each worker before it became ready
+    logger.info(f"Started {workers} worker processes.")
+
+    try:
+        while any(processes):
+            wait([process.sentinel for process in processes if process], timeout=READINESS_INTERVAL)
+            for idx, process in enumerate(processes):
+                if process is None or process.is_alive():
+                    continue
+                processes[idx] = None
+                failures[idx] = 0 if ready_flags[idx].value else failures[idx] + 1
+                ready_flags[idx].value = 0
+                if not process.exitcode:
+                    logger.info(f"Worker process {process.name} stopped.")
+                elif failures[idx] > MAX_RESTARTS:
+                    logger.error(f"Worker process {process.name} exited with code {process.exitcode} "
+                                 f"{failures[idx]} times in a row before it became ready. Stopping all workers.")
+                    for other in filter(None, processes):
+                        other.terminate()
+                        other.join(timeout=SHUTDOWN_TIMEOUT)
+                    sys.exit(1)
+                else:
+                    logger.error(f"Worker process {process.name} exited with code {process.exitcode}, restarting.")
+                    processes[idx] = start_worker(idx)
+            readiness.update_from_workers(ready_flags)
+    except KeyboardInterrupt:
+        logger.info('Interrupted by user. Stopping worker processes...')
+        for process in filter(None, processes):
+            process.join(timeout=SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
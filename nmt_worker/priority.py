@@ -0,0 +1,57 @@
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import List, Tuple, Optional, ContextManager, Iterator
+
+_local = threading.local()
+
+
+class PriorityGate:
+    def __init__(self):
+        """
+        Lets translation threads take turns using the model one generation batch at a time. When several threads are
+        waiting, the one translating the highest-priority request goes next (first come, first served among equal
+        priorities), so a long low-priority document is paused between its batches while interactive requests are
+        translated.
+        """
+        self._condition = threading.Condition()
+        self._active = False
+        self._waiting: List[Tuple[int, int]] = []  # a heap of (-priority, ticket)
+        self._tickets = itertools.count()
+
+    @contextmanager
+    def turn(self, priority: int = 0) -> Iterator[None]:
+        entry = (-priority, next(self._tickets))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            while self._active or self._waiting[0] != entry:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._active = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active = False
+                self._condition.notify_all()
+
+
+@contextmanager
+def request_priority(gate: Optional[PriorityGate], priority: int) -> Iterator[None]:
+    """
+    Translate the generation batches of the current thread with the given priority until the context exits.
+    """
+    _local.gate, _local.priority = gate, priority
+    try:
+        yield
+    finally:
+        _local.gate = None
+
+
+def batch_turn() -> ContextManager:
+    """
+    Wait for the turn of the current thread to generate a batch if a request priority is set, see request_priority.
+    """
+    gate = getattr(_local, 'gate', None)
+    return gate.turn(_local.priority) if gate is not None else nullcontext()
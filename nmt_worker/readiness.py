@@ -0,0 +1,75 @@
+import os
+import atexit
+import logging
+import threading
+from typing import Optional, List
+from multiprocessing.sharedctypes import Synchronized
+
+from nmt_worker.instrumentation import READY
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_ready_file: Optional[str] = None
+_worker_flag: Optional[Synchronized] = None
+
+
+def configure(ready_file: Optional[str] = None):
+    """
+    Set a file that exists only while the worker is consuming requests, e.g. for a container readiness probe.
+    A file left over from a previous run is removed.
+    """
+    global _ready_file
+    _ready_file = ready_file
+    set_not_ready()
+    if ready_file:
+        atexit.register(set_not_ready)
+
+
+def configure_worker(flag: Synchronized):
+    """
+    Report the readiness of a worker process to the parent process through a shared flag, see update_from_workers.
+    The ready file is only managed by the parent process.
+    """
+    global _ready_file, _worker_flag
+    _ready_file = None
+    _worker_flag = flag
+
+
+def update_from_workers(flags: List[Synchronized]):
+    """
+    Mark the parent process of a worker pool ready while all of its worker processes are ready.
+    """
+    if all(flag.value for flag in flags):
+        set_ready()
+    elif is_ready() or (_ready_file and os.path.exists(_ready_file)):
+        set_not_ready()
+
+
+def set_ready():
+    """
+    Mark the worker ready after the model is warmed up and the consumer is bound to its queue.
+    """
+    if _ready.is_set():
+        return
+    _ready.set()
+    READY.set(1)
+    if _worker_flag is not None:
+        _worker_flag.value = 1
+    if _ready_file:
+        with open(_ready_file, 'w'):
+            pass
+    logger.info('Ready to process requests.')
+
+
+def set_not_ready():
+    _ready.clear()
+    READY.set(0)
+    if _worker_flag is not None:
+        _worker_flag.value = 0
+    if _ready_file and os.path.exists(_ready_file):
+        os.remove(_ready_file)
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
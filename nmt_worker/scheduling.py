@@ -0,0 +1,73 @@
+import logging
+from time import perf_counter
+from typing import List, Callable, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    def __init__(self, max_sentences: int, max_tokens: int):
+        """
+        Plans batches for the sentences of a translation call. Sentences are ordered by their subword length and
+        packed greedily so that each batch contains sentences of similar length and the padded batch size
+        (the number of sentences times the longest sentence) does not exceed the token budget.
+        """
+        self.max_sentences = max_sentences
+        self.max_tokens = max_tokens
+
+    def plan(self, lengths: Sequence[int]) -> List[List[int]]:
+        """
+        :param lengths: the number of tokens in each sentence
+        :return: lists of sentence indices, one for each batch, longer sentences first
+        """
+        batches = []
+        batch = []
+        batch_max_len = 0
+        for idx in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+            max_len = max(batch_max_len, lengths[idx])
+            if batch and (len(batch) >= self.max_sentences or (len(batch) + 1) * max_len > self.max_tokens):
+                batches.append(batch)
+                batch = []
+                max_len = lengths[idx]
+            batch.append(idx)
+            batch_max_len = max_len
+        if batch:
+            batches.append(batch)
+        return batches
+
+
+def calibrate(translate: Callable[[List[str], int, int], List[str]], sentences: List[str], lengths: Sequence[int],
+              token_budgets: Sequence[int], repeats: int = 3) -> Tuple[int, int]:
+    """
+    Find the batch budget with the highest throughput by timing a calibration batch for each token budget. The search
+    stops when a larger budget no longer improves the throughput by at least 5%. An untimed batch is translated first
+    and the fastest of several runs is used for each budget, so that one-off allocation costs and noise do not decide
+    the result.
+
+    :param translate: a function that translates a list of sentences with the given max_sentences and max_tokens
+    :param sentences: calibration sentences that are reused to fill the batches
+    :param lengths: the number of subword tokens in each calibration sentence
+    :param token_budgets: token budgets to try in ascending order
+    :param repeats: the number of timed runs for each budget
+    :return: the selected max_sentences and max_tokens values
+    """
+    max_length = max(lengths)
+    best = None
+    best_throughput = 0.0
+    for max_tokens in token_budgets:
+        max_sentences = max(1, max_tokens // max_length)
+        batch = [sentences[idx % len(sentences)] for idx in range(max_sentences)]
+        if best is None:  # untimed warmup
+            translate(batch, max_sentences, max_tokens)
+        duration = float('inf')
+        for _ in range(repeats):
+            start = perf_counter()
+            translate(batch, max_sentences, max_tokens)
+            duration = min(duration, perf_counter() - start)
+        throughput = len(batch) / duration
+        logger.info(f"Calibration batch: {{max_sentences: {max_sentences}, max_tokens: {max_tokens}, "
+                    f"sentences/s: {round(throughput, 2)}}}")
+        if best is not None and throughput < best_throughput * 1.05:
+            break
+        best, best_throughput = (max_sentences, max_tokens), throughput
+    return best
@@ -28,6 +28,7 @@ class Request(BaseModel):
     domain: Optional[str] = None
     application: Optional[str] = None
     input_type: Optional[InputType] = None
+    profile: Optional[str] = None  # a generation profile that trades quality for latency, e.g. "fast"
 
     def __init__(self, **data: Any):
         super(Request, self).__init__(**data)
@@ -0,0 +1,91 @@
+import logging
+from time import time
+from typing import Iterable, Iterator, List, TextIO, Tuple
+
+from nmt_worker.schemas import Request
+from nmt_worker.translator import Translator, PreparedRequest
+
+logger = logging.getLogger(__name__)
+
+
+def read_paragraphs(lines: Iterable[str], max_lines: int) -> Iterator[str]:
+    """
+    Group lines into paragraphs that end with an empty line. Paragraphs longer than max_lines are split at a line
+    break to keep the memory usage bounded.
+    """
+    paragraph = []
+    for line in lines:
+        paragraph.append(line)
+        if not line.strip() or len(paragraph) >= max_lines:
+            yield ''.join(paragraph)
+            paragraph = []
+    if paragraph:
+        yield ''.join(paragraph)
+
+
+def read_batches(lines: Iterable[str], max_lines: int) -> Iterator[List[str]]:
+    """
+    Group paragraphs into batches of roughly max_lines lines.
+    """
+    batch = []
+    batch_lines = 0
+    for paragraph in read_paragraphs(lines, max_lines):
+        batch.append(paragraph)
+        batch_lines += paragraph.count('\n')  # each line of a paragraph ends with a line break
+        if batch_lines >= max_lines:
+            yield batch
+            batch = []
+            batch_lines = 0
+    if batch:
+        yield batch
+
+
+def translate_stream(translator: Translator, input_file: TextIO, output_file: TextIO, src: str, tgt: str,
+                     max_lines: int = 200):
+    """
+    Translate a text stream paragraph by paragraph in bounded batches and write the translations to the output
+    stream in the original order as soon as each batch is finished. If the translator has a pipeline, the next
+    batches are preprocessed and the previous ones are postprocessed while the current batch is translated.
+    """
+    def prepare(batch: List[str]) -> Tuple[List[str], List[PreparedRequest]]:
+        texts = _non_empty(batch)
+        return batch, [translator.prepare_request(Request(text=texts, src=src, tgt=tgt))] if texts else []
+
+    def process(item: Tuple[List[str], List[PreparedRequest]]) -> Tuple[List[str], List[PreparedRequest]]:
+        batch, prepared = item
+        return batch, translator.translate_prepared(prepared)
+
+    def finish(item: Tuple[List[str], List[PreparedRequest]]) -> Tuple[List[str], str]:
+        batch, prepared = item
+        return batch, _merge(batch, translator.finish_prepared(prepared)[0].result if prepared else [])
+
+    def translate_batch(batch: List[str]) -> str:
+        texts = _non_empty(batch)
+        return _merge(batch, translator.process_request(Request(text=texts, src=src, tgt=tgt)).result if texts else [])
+
+    batches = read_batches(input_file, max_lines)
+    if translator.pipeline is not None:
+        results = translator.pipeline.run(batches, prepare, process, finish)
+    else:
+        results = ((batch, translate_batch(batch)) for batch in batches)
+
+    t1 = time()
+    total_lines = 0
+    for batch, output in results:
+        output_file.write(output)
+        output_file.flush()
+
+        total_lines += sum(paragraph.count('\n') for paragraph in batch)
+        elapsed = time() - t1
+        logger.info(f"Progress: {{lines: {total_lines}, duration: {round(elapsed, 1)} s, "
+                    f"lines/s: {round(total_lines / elapsed, 2) if elapsed else 0}}}")
+
+
+def _non_empty(batch: List[str]) -> List[str]:
+    # whitespace-only paragraphs are not sent to the translator to preserve the empty lines
+    return [paragraph for paragraph in batch if paragraph.strip()]
+
+
+def _merge(batch: List[str], translations: List[str]) -> str:
+    translations = iter(translations)
+    return ''.join(next(translations) if paragraph.strip() else paragraph for paragraph in batch)
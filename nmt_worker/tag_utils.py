@@ -13,43 +13,49 @@ tag_patterns = {
     InputType.MEMOQ: r'<[^>]*>'
 }
 
-bpt = r'<[^/>]*>'
-ept = r'</[^>]*>'
+# a tag or a space, the tags are captured so that they end up in odd positions when splitting
+tag_splitters = {input_type: re.compile(rf' |({pattern})') for input_type, pattern in tag_patterns.items()}
 
-# Other symbols do not need replacing
-html_entities = {'<': '&lt;',
-                 '>': '&gt;',
-                 '&': '&amp;'}
+# Other symbols do not need replacing. Ampersands go first so that the inserted entities are not escaped again.
+html_entities = {'&': '&amp;',
+                 '<': '&lt;',
+                 '>': '&gt;'}
+
+
+def _tag_type(tag: str) -> str:
+    """
+    Classify a tag as an opening (bpt), closing (ept) or standalone (ph) tag.
+    """
+    if '/' not in tag:
+        return 'bpt'
+    if tag.startswith('</'):
+        return 'ept'
+    return 'ph'
 
 
 def preprocess_tags(sentences: List[str], input_type: InputType) -> (List[str], List[List[Tuple[str, int, str]]]):
-    if input_type in tag_patterns:
-        pattern = tag_patterns[input_type]
+    """
+    Remove tags from the sentences. Each tag is stored with the index of the word that follows it (-1 if the tag is
+    at the end of the sentence) and its type.
+    """
+    if input_type in tag_splitters:
+        splitter = tag_splitters[input_type]
         clean_sentences = []
         tags = []
         for sentence in sentences:
-            sentence = sentence.strip()
+            items = splitter.split(sentence.strip())
+            tokens = []
             sentence_tags = []  # list of tuples (tag, indexes, tag_type)
-
-            tokens = list(filter(None, re.split(rf' |{pattern}', sentence)))
-            tokens_w_tags = list(filter(None, re.split(rf' |({pattern})', sentence)))
+            for idx, item in enumerate(items):
+                if not item:
+                    continue
+                if idx % 2:
+                    sentence_tags.append((item, len(tokens), _tag_type(item)))
+                else:
+                    tokens.append(item)
 
             clean_sentences.append(' '.join(tokens).strip())
-
-            for idx, item in enumerate(tokens_w_tags):
-                idx = idx - len(sentence_tags)
-                if len(tokens) <= idx or item != tokens[idx]:
-                    if len(tokens) <= idx:
-                        idx = -1
-
-                    if re.match(bpt, item):
-                        sentence_tags.append((item, idx, 'bpt'))
-                    elif re.match(ept, item):
-                        sentence_tags.append((item, idx, 'ept'))
-                    else:
-                        sentence_tags.append((item, idx, 'ph'))
-
-            tags.append(sentence_tags)
+            tags.append([(tag, idx if idx < len(tokens) else -1, tag_type) for tag, idx, tag_type in sentence_tags])
 
     else:
         clean_sentences = sentences
@@ -61,30 +67,39 @@ def preprocess_tags(sentences: List[str], input_type: InputType) -> (List[str],
 
 
 def postprocess_tags(translations: List[str], tags: List[List[Tuple[str, int, str]]], input_type: InputType):
-    translations = [sentence.replace("<unk>", "") for sentence in translations]
-
-    if input_type in tag_patterns:
-        for symbol, entity in html_entities.items():
-            translations = [sentence.replace(symbol, entity) for sentence in translations]
-
+    """
+    Insert the tags back into the translations before the words with the same index. Tags whose index is outside
+    the translation are appended to the end.
+    """
+    escape = input_type in tag_patterns
     retagged = []
 
     for translation, sentence_tags in zip(translations, tags):
-        retagged_sentence = []
+        if "<unk>" in translation:
+            translation = translation.replace("<unk>", "")
+        if escape:
+            for symbol, entity in html_entities.items():
+                if symbol in translation:
+                    translation = translation.replace(symbol, entity)
 
-        tokens = translation.split(' ')
+        retagged_sentence = []
+        tag_idx = 0
+        n_tags = len(sentence_tags)
 
-        for idx, token in enumerate(tokens):
+        for idx, token in enumerate(translation.split(' ')):
             whitespace_added = False
-            while sentence_tags and sentence_tags[0][1] == idx:
-                if not whitespace_added and sentence_tags[0][2] == 'bpt':
+            while tag_idx < n_tags and sentence_tags[tag_idx][1] == idx:
+                tag, _, tag_type = sentence_tags[tag_idx]
+                if not whitespace_added and tag_type == 'bpt':
                     retagged_sentence.append(' ')
                     whitespace_added = True
-                retagged_sentence.append(sentence_tags.pop(0)[0])
+                retagged_sentence.append(tag)
+                tag_idx += 1
             if not whitespace_added:
                 retagged_sentence.append(' ')
             retagged_sentence.append(token)
 
-        retagged.append((''.join(retagged_sentence) + ''.join([tag for tag, _, _ in sentence_tags])).strip())
+        retagged_sentence.extend(tag for tag, _, _ in sentence_tags[tag_idx:])
+        retagged.append(''.join(retagged_sentence).strip())
 
     return retagged
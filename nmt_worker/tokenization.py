@@ -1,24 +1,117 @@
-from typing import List
-from nltk import sent_tokenize
+import re
+import logging
+from math import ceil
+from functools import lru_cache
+from typing import List, Callable, Tuple
 
+import nltk
+from nltk.tokenize.punkt import PunktSentenceTokenizer
 
-def sentence_tokenize(text: str) -> (List, List):
+logger = logging.getLogger(__name__)
+
+# punkt models for the language codes used by the models, other languages use the English model
+PUNKT_LANGUAGES = {
+    'cs': 'czech', 'da': 'danish', 'de': 'german', 'el': 'greek', 'en': 'english', 'es': 'spanish',
+    'et': 'estonian', 'fi': 'finnish', 'fr': 'french', 'it': 'italian', 'nl': 'dutch', 'no': 'norwegian',
+    'pl': 'polish', 'pt': 'portuguese', 'ru': 'russian', 'sl': 'slovene', 'sv': 'swedish', 'tr': 'turkish',
+}
+
+# secondary boundaries used to split long sentences, in order of preference
+SPLIT_PATTERNS = (
+    re.compile(r'\s*\n\s*'),
+    re.compile(r'(?<=[;:])\s+'),
+    re.compile(r'(?<=,)\s+'),
+    re.compile(r'\s+'),
+)
+
+
+@lru_cache(maxsize=None)
+def get_sentence_tokenizer(language: str = 'en') -> PunktSentenceTokenizer:
+    """
+    Load the punkt sentence tokenizer for a language code. Tokenizers are loaded once and reused.
+    """
+    name = PUNKT_LANGUAGES.get(language, 'english')
+    logger.debug(f"Loading the {name} sentence tokenizer for '{language}'")
+    return nltk.data.load(f'tokenizers/punkt/{name}.pickle')
+
+
+def sentence_tokenize(text: str, language: str = 'en') -> (List, List):
     """
     Split text into sentences and save info about delimiters between them to restore linebreaks,
-    whitespaces, etc.
+    whitespaces, etc. The delimiters are sliced from the text using the sentence offsets.
     """
+    sentences = []
     delimiters = []
-    sentences = [sent.strip() for sent in sent_tokenize(text)]
+    end = 0
+    for span_start, span_end in get_sentence_tokenizer(language).span_tokenize(text):
+        sentence = text[span_start:span_end]
+        stripped = sentence.strip()
+        if not stripped:
+            continue
+        start = span_start + len(sentence) - len(sentence.lstrip())
+        delimiters.append(text[end:start])
+        sentences.append(stripped)
+        end = start + len(stripped)
+
     if len(sentences) == 0:
         return [''], ['']
-    else:
-        try:
-            for sentence in sentences:
-                idx = text.index(sentence)
-                delimiters.append(text[:idx])
-                text = text[idx + len(sentence):]
-            delimiters.append(text)
-        except ValueError:
-            delimiters = ['', *[' ' for _ in range(len(sentences) - 1)], '']
+    delimiters.append(text[end:])
 
     return sentences, delimiters
+
+
+def split_long_sentence(sentence: str, length: Callable[[str], int], max_length: int) -> (List, List):
+    """
+    Split a sentence that is longer than max_length into parts at secondary boundaries (line breaks, semicolons and
+    colons, commas and finally any whitespace). Neighbouring parts are merged as long as they fit within the limit.
+    Text without any boundaries is split into parts of equal length.
+
+    :param length: a function that returns the length of a text, e.g. the number of subword tokens
+    :return: the parts and the delimiters between them, so that the sentence can be restored by interleaving them
+    """
+    parts = _split(sentence, length, max_length, 0)
+    return [part for part, _ in parts], [delimiter for _, delimiter in parts[:-1]]
+
+
+def _split(text: str, length: Callable[[str], int], max_length: int, level: int) -> List[Tuple[str, str]]:
+    # a subword token covers at least one character, except for a possible leading word boundary token
+    if len(text) < max_length or length(text) <= max_length:
+        return [(text, '')]
+
+    if level == len(SPLIT_PATTERNS):
+        n_parts = ceil(length(text) / max_length)
+        size = ceil(len(text) / n_parts)
+        return [(text[idx:idx + size], '') for idx in range(0, len(text), size)]
+
+    pieces = []
+    start = 0
+    for match in SPLIT_PATTERNS[level].finditer(text):
+        if match.start() > start:
+            pieces.append((text[start:match.start()], match.group()))
+            start = match.end()
+    pieces.append((text[start:], ''))
+    if len(pieces) == 1:
+        return _split(text, length, max_length, level + 1)
+
+    parts = []
+    current, current_delimiter, current_length = pieces[0][0], pieces[0][1], length(pieces[0][0])
+    for piece, delimiter in pieces[1:]:
+        piece_length = length(piece)
+        if current_length + piece_length <= max_length:
+            current = current + current_delimiter + piece
+            current_length += piece_length
+        else:
+            parts.extend(_flush(current, current_delimiter, current_length, length, max_length, level))
+            current, current_length = piece, piece_length
+        current_delimiter = delimiter
+    parts.extend(_flush(current, current_delimiter, current_length, length, max_length, level))
+    return parts
+
+
+def _flush(text: str, delimiter: str, text_length: int, length: Callable[[str], int], max_length: int,
+           level: int) -> List[Tuple[str, str]]:
+    if text_length <= max_length:
+        return [(text, delimiter)]
+    parts = _split(text, length, max_length, level + 1)
+    parts[-1] = (parts[-1][0], delimiter)
+    return parts
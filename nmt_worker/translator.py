@@ -1,62 +1,572 @@
 import os
+import glob
 import itertools
 import logging
 import warnings
+from time import time
+from collections import defaultdict
+from typing import List, Tuple, Optional, Dict, Any
 
 import torch
 
-from .config import ModelConfig
-from .schemas import Response, Request
+from .config import ModelConfig, BatchBudget, GenerationProfile
+from .cache import TranslationCache
+from .instrumentation import Timings, REQUEST_DURATION, SENTENCES, TOKENS, CACHE_LOOKUPS, MODEL_LOAD_TIME
+from .schemas import Response, Request, InputType
 from .tag_utils import preprocess_tags, postprocess_tags
 from .normalization import normalize
-from .tokenization import sentence_tokenize
-from .modular_interface import ModularHubInterface
+from .tokenization import sentence_tokenize, split_long_sentence, get_sentence_tokenizer
+from .filtering import is_passthrough
+from .modular_interface import ModularHubInterface, TORCHSCRIPT_FILE
+from .scheduling import calibrate
+from .pipeline import Pipeline
 
 logger = logging.getLogger(__name__)
 
 warnings.filterwarnings('ignore', '.*__floordiv__*', )
 
 
+class PreparedText:
+    def __init__(self, sentences: List[str], delimiters: List[str], tags: List[List[Tuple[str, int, str]]],
+                 normalized: List[str], parts: Optional[List[Tuple[List[str], List[str]]]] = None,
+                 passthrough: Optional[List[Optional[str]]] = None):
+        """
+        A single text segment that has been split into sentences, detagged and normalized.
+
+        :param parts: the parts that each normalized sentence is translated in and the delimiters between them, if
+        long sentences have been split
+        :param passthrough: the output of each sentence that is not passed to the model or None if it should be
+        translated, by default only empty sentences are skipped
+        """
+        self.sentences = sentences
+        self.delimiters = delimiters
+        self.tags = tags
+        self.normalized = normalized
+        self.parts = parts if parts is not None else [([sentence], []) for sentence in normalized]
+        self.passthrough = passthrough if passthrough is not None else \
+            ['' if sentence == '' else None for sentence in normalized]
+        self.translated: List[str] = []
+
+    @property
+    def inputs(self) -> List[str]:
+        """
+        The sentences or sentence parts that are passed to the model.
+        """
+        return [part for (parts, _), output in zip(self.parts, self.passthrough) if output is None for part in parts]
+
+    def set_translations(self, translations: List[str]):
+        """
+        Join the translations of the model inputs back into sentences. Skipped sentences are copied from the
+        passthrough outputs.
+        """
+        self.translated = []
+        offset = 0
+        for (parts, delimiters), output in zip(self.parts, self.passthrough):
+            if output is not None:
+                self.translated.append(output)
+                continue
+            translated = translations[offset:offset + len(parts)]
+            offset += len(parts)
+            self.translated.append(translated[0] + ''.join(delimiter + translation for delimiter, translation
+                                                           in zip(delimiters, translated[1:])))
+
+
+class PreparedRequest:
+    def __init__(self, request: Request, segments: List[PreparedText], timings: Timings,
+                 profile: GenerationProfile = GenerationProfile(), model_name: Optional[str] = None):
+        """
+        A request that has been preprocessed and is ready to be passed to the model.
+        """
+        self.request = request
+        self.segments = segments
+        self.timings = timings
+        self.profile = profile
+        self.model_name = model_name
+
+    @property
+    def language_pair(self) -> Tuple[str, str]:
+        return self.request.src, self.request.tgt
+
+    @property
+    def batch_key(self) -> Tuple[str, str, GenerationProfile]:
+        """
+        Requests with the same language pair and generation settings can be translated together.
+        """
+        return self.request.src, self.request.tgt, self.profile
+
+    @property
+    def n_sentences(self) -> int:
+        return sum(len(segment.normalized) for segment in self.segments)
+
+    @property
+    def n_tokens(self) -> int:
+        """
+        The approximate number of tokens based on whitespace, used for batching before subword segmentation.
+        """
+        return sum(len(sentence.split()) for segment in self.segments for sentence in segment.normalized)
+
+
 class Translator:
     model = None
+    cache = None
+    pipeline = None
 
-    def __init__(self, model_config: ModelConfig):
+    def __init__(self, model_config: ModelConfig, model: Optional[ModularHubInterface] = None):
+        """
+        :param model: an already loaded model, e.g. for benchmarks, the checkpoint in the config is loaded by default
+        """
         self.model_config = model_config
-        self._load_model()
+        t1 = time()
+        self._load_model(model)
+        MODEL_LOAD_TIME.set(round(time() - t1, 3), model=self.model_config.model_name)
+
+        for src in {src for src, _ in self.language_pairs}:
+            get_sentence_tokenizer(src)
+
+        self.batch_budgets = self._get_batch_budgets()
+        self.engine_fingerprint = self._get_engine_fingerprint()
+
+        self.init_cache()
+        if self.model_config.pipeline is not None:
+            self.pipeline = Pipeline(threads=self.model_config.pipeline.threads,
+                                     queue_size=self.model_config.pipeline.queue_size)
 
         logger.info("All models loaded")
 
-    def _load_model(self):
-        sentencepiece_path = os.path.join(self.model_config.sentencepiece_dir, self.model_config.sentencepiece_prefix)
-        self.model = ModularHubInterface.from_pretrained(
-            model_path=self.model_config.checkpoint_path,
-            sentencepiece_prefix=sentencepiece_path,
-            dictionary_path=self.model_config.dict_dir)
+    def _load_model(self, model: Optional[ModularHubInterface] = None):
+        snapshot_path = self.model_config.snapshot_path if model is None else None
+        if model is None and snapshot_path is not None:
+            try:
+                model = ModularHubInterface.load_snapshot(snapshot_path, self._snapshot_key())
+            except Exception as e:
+                logger.warning(f"Model snapshot {snapshot_path} could not be loaded, loading the checkpoint: {e}")
+            if model is not None:
+                logger.info(f"Model loaded from snapshot {snapshot_path}.")
+                snapshot_path = None
+
+        if model is not None:
+            self.model = model
+        else:
+            self.model = ModularHubInterface.from_pretrained(
+                model_path=self.model_config.checkpoint_path,
+                sentencepiece_prefix=self._sentencepiece_prefix,
+                dictionary_path=self.model_config.dict_dir,
+                language_pairs=self.language_pairs if self.model_config.selective_loading else None,
+                lazy_loading=self.model_config.lazy_loading)
         if torch.cuda.is_available():
             self.model.cuda()
+        else:
+            self._configure_cpu()
+
+        if snapshot_path is not None:
+            try:
+                self.model.save_snapshot(snapshot_path, self._snapshot_key())
+                logger.info(f"Model snapshot saved to {snapshot_path}.")
+            except Exception as e:
+                logger.warning(f"Model snapshot could not be saved to {snapshot_path}: {e}")
+
+        if self.model.scripted_generators is None:  # scripted generators are looked up on first use
+            for src, tgt in self.language_pairs:
+                for profile in self.model_config.generation_profiles.values():
+                    self.model.get_generator(src, tgt, **profile.dict())
 
-    def process_request(self, request: Request) -> Response:
+    def _configure_cpu(self):
+        cpu_config = self.model_config.cpu
+        if cpu_config.threads:
+            torch.set_num_threads(cpu_config.threads)
+        if cpu_config.interop_threads:
+            try:
+                torch.set_num_interop_threads(cpu_config.interop_threads)
+            except RuntimeError as e:
+                logger.warning(f"Unable to set the number of inter-op threads: {e}")
+        if cpu_config.quantize and not self.model.quantized:
+            self.model.quantize()
+            logger.info("Model quantized for CPU inference.")
+        if cpu_config.torchscript_dir:
+            self.model.use_torchscript(cpu_config.torchscript_dir)
+            logger.info(f"Using TorchScript generators from {cpu_config.torchscript_dir}.")
+
+    def _get_batch_budgets(self) -> Dict[Tuple[str, str], BatchBudget]:
+        budgets = {}
+        for language_pair, budget in self.model_config.batching.language_pairs.items():
+            source, target = language_pair.split('-')
+            budgets[(self.model_config.language_codes[source], self.model_config.language_codes[target])] = budget
+        return budgets
+
+    @property
+    def _sentencepiece_prefix(self) -> str:
+        return os.path.join(self.model_config.sentencepiece_dir, self.model_config.sentencepiece_prefix)
+
+    def _snapshot_key(self) -> Dict[str, Any]:
+        """
+        Identify the model files and the loading settings, so that a snapshot is not used after any of them change.
+        """
+        paths = [self.model_config.checkpoint_path,
+                 *glob.glob(os.path.join(self.model_config.dict_dir, 'dict.*.txt')),
+                 *glob.glob(f'{self._sentencepiece_prefix}.*.model')]
+        return {
+            'files': sorted((os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)) for path in paths),
+            'language_pairs': self.language_pairs if self.model_config.selective_loading else None,
+            'lazy_loading': self.model_config.lazy_loading,
+            'quantized': self.model_config.cpu.quantize and not torch.cuda.is_available(),
+        }
+
+    def _get_engine_fingerprint(self) -> List[Any]:
+        """
+        Identify the model weights and the inference implementation in cache keys, so that translations of a
+        quantized or TorchScript model are not served for the original model or after the checkpoint changes.
+        """
+        torchscript_path = os.path.join(self.model_config.cpu.torchscript_dir, TORCHSCRIPT_FILE) \
+            if self.model.scripted_generators is not None else None
+        fingerprint = [self.model_config.model_name, self.model.quantized]
+        for path in (self.model_config.checkpoint_path, torchscript_path):
+            fingerprint.append([path, os.path.getmtime(path)] if path and os.path.exists(path) else path)
+        return fingerprint
+
+    def warmup(self):
+        """
+        Calibrate the batch budget if enabled and translate synthetic batches for each language pair and generation
+        profile, so that the memory allocation and kernel selection costs are not paid by the first requests. This
+        should be called in the process that consumes the requests, after its number of threads is set.
+        """
+        if self.model_config.batching.calibrate:
+            self._calibrate()
+        if not self.model_config.warmup_batches:
+            return
+        t1 = time()
+        for src, tgt in self.language_pairs:
+            budget = self.get_batch_budget(src, tgt)
+            sentences = self._synthetic_sentences(src)[:budget.max_sentences]
+            for profile in set(self.model_config.generation_profiles.values()):
+                for _ in range(self.model_config.warmup_batches):
+                    self.model.translate(sentences, src_language=src, tgt_language=tgt,
+                                         max_sentences=budget.max_sentences, max_tokens=budget.max_tokens,
+                                         **profile.dict())
+        logger.info(f"Warmup finished in {round(time() - t1, 2)} s.")
+
+    def _synthetic_sentences(self, language: str, sentence_length: int = 20) -> List[str]:
+        """
+        Build sentences from whole-word subword units of the dictionary for calibration and warmup.
+        """
+        words = [symbol.lstrip('\u2581') for symbol in self.model.dicts[language].symbols
+                 if symbol.startswith('\u2581') and len(symbol) > 3][:1000]
+        sentences = [' '.join(words[idx:idx + sentence_length]) + '.'
+                     for idx in range(0, len(words) - sentence_length, sentence_length)]
+        return sentences or [' '.join(words) + '.']
+
+    def get_batch_budget(self, src: str, tgt: str) -> BatchBudget:
+        return self.batch_budgets.get((src, tgt), self.model_config.batching)
+
+    def _calibrate(self):
+        """
+        Replace the default batch budget with the one that has the highest throughput for the first language pair.
+        The calibration sentences are built from whole-word subword units of the source dictionary.
+        """
+        src, tgt = self.language_pairs[0]
+        sentences = self._synthetic_sentences(src)
+
+        max_sentences, max_tokens = calibrate(
+            lambda batch, batch_sentences, batch_tokens: self.model.translate(
+                batch, src_language=src, tgt_language=tgt, max_sentences=batch_sentences, max_tokens=batch_tokens),
+            sentences, [self.model.count_tokens(sentence, src) for sentence in sentences],
+            self.model_config.batching.calibration_budgets)
+        self.model_config.batching.max_sentences = max_sentences
+        self.model_config.batching.max_tokens = max_tokens
+        logger.info(f"Batch budget calibrated: {{max_sentences: {max_sentences}, max_tokens: {max_tokens}}}")
+
+    def init_cache(self):
+        """
+        (Re)create the translation cache. This should also be called in forked processes so that they would not share
+        the database connection of the parent process.
+        """
+        if self.model_config.cache is not None:
+            self.cache = TranslationCache(**self.model_config.cache.dict())
+
+    def close(self):
+        """
+        Release the pipeline threads and the persistent cache connection when the model is unloaded. Requests that
+        are still being translated can finish without them.
+        """
+        if self.pipeline is not None:
+            self.pipeline.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    @property
+    def model_configs(self) -> List[ModelConfig]:
+        return [self.model_config]
+
+    def share_memory(self):
+        """
+        Move the model weights to shared memory so that forked worker processes can use the same copy.
+        """
+        self.model.share_memory()
+
+    @property
+    def language_pairs(self) -> List[Tuple[str, str]]:
+        """
+        Language pairs served by this worker using the language codes of the model.
+        """
+        pairs = set()
+        for domain in self.model_config.domains:
+            for language_pair in domain.language_pairs:
+                source, target = language_pair.split('-')
+                pairs.add((self.model_config.language_codes[source], self.model_config.language_codes[target]))
+        return sorted(pairs)
+
+    def process_request(self, request: Request, timings: Optional[Timings] = None) -> Response:
+        """
+        Translate a single request. All segments of a list request are split into sentences and translated together
+        in a single call, the model sorts the sentences by length to build the batches. If the pipeline is enabled,
+        long requests are translated in chunks instead and the text processing of the neighbouring chunks runs
+        concurrently with the translation.
+        """
+        if self.pipeline is not None:
+            return self._process_pipelined(request, timings if timings is not None else Timings())
+        return self.process_prepared([self.prepare_request(request, timings)])[0]
+
+    def prepare_request(self, request: Request, timings: Optional[Timings] = None) -> PreparedRequest:
+        """
+        Apply the text preprocessing steps of a request so that it could be translated later along with other
+        requests. The duration of each step is added to the timings object if it is given.
+        """
+        timings = timings if timings is not None else Timings()
+        profile = self._start_request(request)
+        inputs = [request.text] if type(request.text) == str else request.text
+
+        segments = []
+        for text in inputs:
+            with timings.measure('sentence_split'):
+                sentences, delimiters = sentence_tokenize(text, request.src)
+            segments.append(self._prepare_text(sentences, delimiters, request, timings))
+
+        return PreparedRequest(request, segments, timings, profile, self.model_config.model_name)
+
+    def _start_request(self, request: Request) -> GenerationProfile:
+        """
+        Log the request, select its generation profile and map its language codes to the ones used by the model.
+        """
         logger.info(f"Request received: {{"
                     f"application: {request.application}, "
                     f"input type: {request.input_type}, "
                     f"src: {request.src}, "
                     f"tgt: {request.tgt}, "
                     f"domain: {request.domain}}}")
+        profile = self.get_generation_profile(request)
         request.src = self.model_config.language_codes[request.src]
         request.tgt = self.model_config.language_codes[request.tgt]
-        inputs = [request.text] if type(request.text) == str else request.text
+        return profile
 
-        translations = []
-
-        for text in inputs:
-            sentences, delimiters = sentence_tokenize(text)
+    def _prepare_text(self, sentences: List[str], delimiters: List[str], request: Request,
+                      timings: Timings) -> PreparedText:
+        with timings.measure('tags'):
             detagged, tags = preprocess_tags(sentences, request.input_type)
+        with timings.measure('normalization'):
             normalized = [normalize(sentence) for sentence in detagged]
-            translated = [translation if normalized[idx] != '' else '' for idx, translation in enumerate(
-                self.model.translate(normalized, src_language=request.src, tgt_language=request.tgt))]
-            retagged = postprocess_tags(translated, tags, request.input_type)
-            translations.append(''.join(itertools.chain.from_iterable(zip(delimiters, retagged))) + delimiters[-1])
+        with timings.measure('filtering'):
+            passthrough = self._get_passthrough(detagged, normalized)
+        with timings.measure('length_split'):
+            parts = self._split_long_sentences(
+                [sentence if output is None else '' for sentence, output in zip(normalized, passthrough)],
+                request.src, request.tgt)
+        return PreparedText(sentences, delimiters, tags, normalized, parts, passthrough)
+
+    def _process_pipelined(self, request: Request, timings: Timings) -> Response:
+        """
+        Split the sentences of a request into chunks and translate them one by one. The next chunks are detagged and
+        normalized and the previous ones are retagged in the pipeline threads during the translation.
+        """
+        profile = self._start_request(request)
+        inputs = [request.text] if type(request.text) == str else request.text
+        with timings.measure('sentence_split'):
+            texts = [sentence_tokenize(text, request.src) for text in inputs]
+        chunks = _make_chunks([len(sentences) for sentences, _ in texts], self.model_config.pipeline.chunk_sentences)
+
+        def prepare(chunk: List[Tuple[int, int, int]]) -> List[PreparedRequest]:
+            chunk_timings = Timings()
+            segments = [self._prepare_text(texts[idx][0][start:end], texts[idx][1][start:end] + [''], request,
+                                           chunk_timings) for idx, start, end in chunk]
+            return [PreparedRequest(request, segments, chunk_timings, profile, self.model_config.model_name)]
+
+        def finish(prepared: List[PreparedRequest]) -> Tuple[List[List[str]], Timings]:
+            item = prepared[0]
+            return [self._retag(segment, request.input_type, item.timings) for segment in item.segments], item.timings
+
+        if len(chunks) == 1:
+            results = [finish(self.translate_prepared(prepare(chunks[0])))]
+        else:
+            logger.info(f"Translating {sum(len(sentences) for sentences, _ in texts)} sentences in {len(chunks)} "
+                        f"chunks.")
+            results = self.pipeline.run(chunks, prepare, self.translate_prepared, finish)
+
+        translated = [[] for _ in texts]
+        for chunk, (retagged, chunk_timings) in zip(chunks, results):
+            for (idx, _, _), sentences in zip(chunk, retagged):
+                translated[idx].extend(sentences)
+            timings.update(chunk_timings)
+
+        translations = [_join(delimiters, sentences) for (_, delimiters), sentences in zip(texts, translated)]
+        return self._respond(request, translations, timings)
+
+    def get_generation_profile(self, request: Request) -> GenerationProfile:
+        """
+        Select the generation profile requested by the client, the default profile of the request domain or the
+        default profile of the model. Unknown profiles are ignored.
+        """
+        profiles = self.model_config.generation_profiles
+        if request.profile is not None:
+            if request.profile in profiles:
+                return profiles[request.profile]
+            logger.warning(f"Unknown generation profile: {request.profile}")
+        for domain in self.model_config.domains:
+            if domain.name == request.domain and domain.generation_profile is not None:
+                return profiles[domain.generation_profile]
+        return profiles[self.model_config.default_generation_profile]
+
+    def _get_passthrough(self, detagged: List[str], normalized: List[str]) -> List[Optional[str]]:
+        """
+        Find the sentences that are copied to the output instead of being translated. Empty sentences are always
+        skipped, while numbers, URLs, e-mail addresses and punctuation are only skipped if enabled in the config.
+        """
+        skip = self.model_config.skip_untranslatable
+        return ['' if sentence == '' else original if skip and is_passthrough(sentence) else None
+                for original, sentence in zip(detagged, normalized)]
+
+    def _split_long_sentences(self, sentences: List[str], src: str, tgt: str) -> List[Tuple[List[str], List[str]]]:
+        """
+        Split the sentences that are longer than the maximum sentence length (in subword tokens) at secondary
+        boundaries so that the translation time of each input is bounded.
+        """
+        max_length = self.model_config.max_sentence_length
+        if max_length is None or all(len(sentence) < max_length for sentence in sentences):
+            return [([sentence], []) for sentence in sentences]
+
+        if not self.model.has_language_pair(src, tgt):
+            self.model.load_language_pair(src, tgt)
+        parts = [split_long_sentence(sentence, lambda text: self.model.count_tokens(text, src), max_length)
+                 for sentence in sentences]
+        n_split = sum(len(sentence_parts) > 1 for sentence_parts, _ in parts)
+        if n_split:
+            logger.info(f"Split {n_split} long sentence(s) into {sum(len(p) for p, _ in parts)} parts.")
+        return parts
+
+    def process_prepared(self, prepared: List[PreparedRequest]) -> List[Response]:
+        """
+        Translate several preprocessed requests at once. Sentences from all requests that share a language pair are
+        passed to the model in a single call and the results are scattered back to their requests.
+        """
+        return self.finish_prepared(self.translate_prepared(prepared))
+
+    def translate_prepared(self, prepared: List[PreparedRequest]) -> List[PreparedRequest]:
+        """
+        Pass the sentences of preprocessed requests to the model and store the translations in their segments.
+        """
+        groups = defaultdict(list)
+        for item in prepared:
+            groups[item.batch_key].append(item)
+
+        for (src, tgt, profile), items in groups.items():
+            inputs = [sentence for item in items for segment in item.segments for sentence in segment.inputs]
+            n_sentences = sum(item.n_sentences for item in items)
+            logger.info(f"Translating {n_sentences} sentences from {len(items)} request(s).")
+            batch_timings = Timings()
+            batch_timings.count('requests', len(items))
+            batch_timings.count('sentences', len(inputs))
+            translated = self._translate(inputs, src, tgt, batch_timings, **profile.dict()) if inputs else []
+            batch_timings.record()  # once for all requests in the batch
+            batch_timings.record_counts()
+            SENTENCES.inc(n_sentences)
+            TOKENS.inc(batch_timings.counts.get('source_tokens', 0), side='source')
+            TOKENS.inc(batch_timings.counts.get('target_tokens', 0), side='target')
+            logger.debug(f"Translation call finished: {batch_timings}")
+            offset = 0
+            for item in items:
+                for segment in item.segments:
+                    n_inputs = len(segment.inputs)
+                    segment.set_translations(translated[offset:offset + n_inputs])
+                    offset += n_inputs
+                item.timings.update(batch_timings, shared=True)
+
+        return prepared
+
+    def finish_prepared(self, prepared: List[PreparedRequest]) -> List[Response]:
+        """
+        Restore the tags and delimiters of translated requests and build the responses.
+        """
+        responses = []
+        for item in prepared:
+            translations = [_join(segment.delimiters, self._retag(segment, item.request.input_type, item.timings))
+                            for segment in item.segments]
+            responses.append(self._respond(item.request, translations, item.timings))
+        return responses
+
+    @staticmethod
+    def _retag(segment: PreparedText, input_type: InputType, timings: Timings) -> List[str]:
+        with timings.measure('retag'):
+            return postprocess_tags(segment.translated, segment.tags, input_type)
+
+    @staticmethod
+    def _respond(request: Request, translations: List[str], timings: Timings) -> Response:
+        timings.record()
+        REQUEST_DURATION.observe(timings.elapsed(), src=request.src, tgt=request.tgt, domain=request.domain)
+        return Response(result=translations[0] if type(request.text) == str else translations)
+
+    def _translate(self, sentences: List[str], src: str, tgt: str, timings: Timings, **generation_args) -> List[str]:
+        """
+        Translate the sentences using the cache if it is enabled. Only the unique sentences that are missing from the
+        cache are passed to the model. Any generation arguments are passed to the model and are a part of the cache
+        key.
+        """
+        budget = self.get_batch_budget(src, tgt)
+        if self.cache is None:
+            return self.model.translate(sentences, src_language=src, tgt_language=tgt, timings=timings,
+                                        max_sentences=budget.max_sentences, max_tokens=budget.max_tokens,
+                                        **generation_args)
+
+        settings = sorted(generation_args.items())
+        keys = [self.cache.make_key(self.engine_fingerprint, src, tgt, settings, sentence) for sentence in sentences]
+        with timings.measure('cache'):
+            translations = [self.cache.get(key) for key in keys]
+
+        missing = {}
+        for key, sentence, translation in zip(keys, sentences, translations):
+            if translation is None and key not in missing:
+                missing[key] = sentence
+        logger.info(f"Translation cache: {{hits: {len(sentences) - len(missing)}, misses: {len(missing)}}}")
+        CACHE_LOOKUPS.inc(len(sentences) - len(missing), result='hit')
+        CACHE_LOOKUPS.inc(len(missing), result='miss')
+
+        if missing:
+            new_translations = dict(zip(missing.keys(), self.model.translate(
+                list(missing.values()), src_language=src, tgt_language=tgt, timings=timings,
+                max_sentences=budget.max_sentences, max_tokens=budget.max_tokens, **generation_args)))
+            self.cache.put_many(list(new_translations.items()))
+            translations = [translation if translation is not None else new_translations[key]
+                            for key, translation in zip(keys, translations)]
+
+        return translations
+
+
+def _join(delimiters: List[str], sentences: List[str]) -> str:
+    return ''.join(itertools.chain.from_iterable(zip(delimiters, sentences))) + delimiters[-1]
+
 
-        response = Response(result=translations[0] if type(request.text) == str else translations)
+def _make_chunks(lengths: List[int], chunk_size: int) -> List[List[Tuple[int, int, int]]]:
+    """
+    Split consecutive texts with the given numbers of sentences into chunks of up to chunk_size sentences.
 
-        return response
+    :return: a list of (text index, start, end) sentence ranges for each chunk
+    """
+    chunks = [[]]
+    size = 0
+    for idx, length in enumerate(lengths):
+        start = 0
+        while start < length:
+            if size == chunk_size:
+                chunks.append([])
+                size = 0
+            end = min(length, start + chunk_size - size)
+            chunks[-1].append((idx, start, end))
+            size += end - start
+            start = end
+    return chunks
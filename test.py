@@ -1,7 +1,35 @@
+import os
+import json
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+
+import pika
+import torch
 
 from nmt_worker import Translator, read_model_config
-from nmt_worker.schemas import Response, Request
+from nmt_worker.schemas import Response, Request, InputType
+from nmt_worker.instrumentation import render_metrics
+from nmt_worker.tokenization import split_long_sentence, sentence_tokenize, get_sentence_tokenizer
+from nmt_worker.filtering import is_passthrough
+from nmt_worker.normalization import normalize, normalize_reference
+from nmt_worker.tag_utils import preprocess_tags, postprocess_tags
+from nmt_worker.export import export_generators
+from nmt_worker.modular_interface import ModularHubInterface
+from nmt_worker.config import MQConfig, PipelineConfig, ModelConfig, CacheConfig
+from nmt_worker.cache import TranslationCache
+from nmt_worker.pipeline import Pipeline
+from nmt_worker.scheduling import calibrate
+from nmt_worker.translator import _make_chunks
+from nmt_worker.async_mq_consumer import AsyncMQConsumer
+from nmt_worker.mq_consumer import MQConsumer
+from nmt_worker.priority import PriorityGate
+from benchmarks.tiny_model import build_tiny_model, tiny_model_config, random_sentence
 
 
 class Septilang(unittest.TestCase):
@@ -37,6 +65,491 @@ class Septilang(unittest.TestCase):
         self.assertIsInstance(response.result, list)
         self.assertEqual(len(response.result), len(request.text))
 
+    def test_metrics(self):
+        """
+        Check that processed requests are exported as metrics.
+        """
+        request = Request(text="Tere!", src="est", tgt="eng", domain="general")
+        self.translator.process_request(request)
+        metrics = render_metrics()
+        self.assertIn('nmt_request_duration_seconds_count{src="et",tgt="en",domain="general"}', metrics)
+        self.assertIn('nmt_stage_duration_seconds_count{stage="generate"}', metrics)
+
+
+class SentenceSplitting(unittest.TestCase):
+    def test_sentence_delimiters(self):
+        """
+        Check that the sentences and the whitespace between them restore the original text.
+        """
+        for text in ("Tere. Kuidas läheb?", "  Tere.   Kuidas läheb?\n\n", "\n Tere.\n\n\tKuidas läheb? ", "Tere"):
+            sentences, delimiters = sentence_tokenize(text, 'et')
+            self.assertEqual(len(delimiters), len(sentences) + 1)
+            self.assertEqual(''.join(d + s for d, s in zip(delimiters, sentences)) + delimiters[-1], text)
+            self.assertEqual(sentences, [sentence.strip() for sentence in sentences])
+        self.assertEqual(sentence_tokenize("  Tere.   Kuidas läheb?\n\n", 'et'),
+                         (["Tere.", "Kuidas läheb?"], ["  ", "   ", "\n\n"]))
+
+    def test_language_tokenizers(self):
+        """
+        Check that languages with a punkt model load their own model and other languages use the English one.
+        """
+        get_sentence_tokenizer.cache_clear()
+        self.addCleanup(get_sentence_tokenizer.cache_clear)
+        with mock.patch('nltk.data.load', side_effect=lambda resource: mock.Mock(name=resource)) as load:
+            german = get_sentence_tokenizer('de')
+            self.assertIs(get_sentence_tokenizer('de'), german)
+            self.assertIsNot(get_sentence_tokenizer('en'), german)
+            get_sentence_tokenizer('lt')
+        self.assertEqual([call.args[0] for call in load.call_args_list],
+                         ['tokenizers/punkt/german.pickle', 'tokenizers/punkt/english.pickle',
+                          'tokenizers/punkt/english.pickle'])
+
+    def test_long_sentence_splitting(self):
+        """
+        Check that long sentences are split at secondary boundaries into parts that fit within the limit and can be
+        joined back together.
+        """
+        sentence = "one two three; four five, six seven eight nine ten eleven\ntwelve"
+        parts, delimiters = split_long_sentence(sentence, lambda text: len(text.split()), 4)
+        self.assertEqual(parts, ["one two three;", "four five,", "six seven eight nine", "ten eleven", "twelve"])
+        self.assertEqual(parts[0] + ''.join(d + p for d, p in zip(delimiters, parts[1:])), sentence)
+
+    def test_short_sentence(self):
+        parts, delimiters = split_long_sentence("Tere!", len, 200)
+        self.assertEqual(parts, ["Tere!"])
+        self.assertEqual(delimiters, [])
+
+
+class Filtering(unittest.TestCase):
+    def test_passthrough(self):
+        """
+        Check that segments without translatable text are detected.
+        """
+        for segment in ["", "12,5 %", "2023-01-01", "...", "https://www.neurotolge.ee", "info@tartunlp.ai"]:
+            self.assertTrue(is_passthrough(segment), segment)
+        for segment in ["Tere!", "5 km", "Vaata https://www.neurotolge.ee"]:
+            self.assertFalse(is_passthrough(segment), segment)
+
+
+class Normalization(unittest.TestCase):
+    def test_reference_equivalence(self):
+        """
+        Check that the normalizer produces the same output as the reference implementation on random text that is
+        dense in the characters affected by normalization rules.
+        """
+        alphabet = list(" \xa0\r\n()%:;?!.,`´′‘‚’'\"„“”«»\xad–‐‒−—…-0123456789") + \
+            ["  ", " (", ") ", "''", "Tere", "päev", "Привет", "weiß", "hyvää"]
+        rng = random.Random(0)
+        for _ in range(100000):
+            sentence = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+            self.assertEqual(normalize(sentence), normalize_reference(sentence), repr(sentence))
+
+
+class TagProcessing(unittest.TestCase):
+    def check_tags(self, input_type, sentences, detagged, tags, translations, retagged):
+        result, result_tags = preprocess_tags(sentences, input_type)
+        self.assertEqual(result, detagged)
+        self.assertEqual(result_tags, tags)
+        self.assertEqual(postprocess_tags(translations, result_tags, input_type), retagged)
+
+    def test_sdl(self):
+        self.check_tags(
+            InputType.SDL,
+            ["<1 id=1/>Tere <2 id=2>maailm</2>!", "<3 id=3>Esimene</3> ja <4 id=4/>teine", "Ilma &amp; siltideta",
+             "<5 id=5/>"],
+            ["Tere maailm !", "Esimene ja teine", "Ilma & siltideta", ""],
+            [[("<1 id=1/>", 0, "ph"), ("<2 id=2>", 1, "bpt"), ("</2>", 2, "ept")],
+             [("<3 id=3>", 0, "bpt"), ("</3>", 1, "ept"), ("<4 id=4/>", 2, "ph")], [], [("<5 id=5/>", -1, "ph")]],
+            ["Hello <world>!", "First and second &", "Without & tags", ""],
+            ["<1 id=1/> Hello <2 id=2>&lt;world&gt;!</2>", "<3 id=3>First</3> and<4 id=4/> second &amp;",
+             "Without &amp; tags", "<5 id=5/>"])
+
+    def test_memoq(self):
+        self.check_tags(
+            InputType.MEMOQ,
+            ["<b>Paks</b> ja <i>kaldkiri</i> <br/> lõpp<x/>", '<a href="http://x.ee/a">link</a>'],
+            ["Paks ja kaldkiri lõpp", "link"],
+            [[("<b>", 0, "bpt"), ("</b>", 1, "ept"), ("<i>", 2, "bpt"), ("</i>", 3, "ept"), ("<br/>", 3, "ph"),
+              ("<x/>", -1, "ph")], [('<a href="http://x.ee/a">', 0, "ph"), ("</a>", -1, "ept")]],
+            ["Bold and italics <unk> end", "link"],
+            ["<b>Bold</b> and <i>italics</i><br/>  end<x/>", '<a href="http://x.ee/a"> link</a>'])
+
+    def test_memsource(self):
+        self.check_tags(InputType.MEMSOURCE, ["{b>Tere<b} &lt;maailm&gt;"], ["{b>Tere<b} <maailm>"], [[]],
+                        ["{b>Hello<b} <world> <unk>"], ["{b>Hello<b} <world>"])
+
+
+class Pipelining(unittest.TestCase):
+    def test_order(self):
+        def sleep(x):
+            time.sleep(random.random() / 100)
+            return x
+
+        random.seed(1)
+        for threads, queue_size in ((1, 1), (2, 2), (4, 3)):
+            results = list(Pipeline(threads, queue_size).run(range(50), sleep, lambda x: x * 2, sleep))
+            self.assertEqual(results, [x * 2 for x in range(50)])
+        self.assertEqual(list(Pipeline().run([], sleep, sleep, sleep)), [])
+
+    def test_chunks(self):
+        random.seed(1)
+        for chunk_size in (1, 3, 64):
+            lengths = [random.randint(0, 100) for _ in range(20)]
+            chunks = _make_chunks(lengths, chunk_size)
+            self.assertTrue(all(0 < sum(end - start for _, start, end in chunk) <= chunk_size for chunk in chunks))
+            covered = [(idx, i) for chunk in chunks for idx, start, end in chunk for i in range(start, end)]
+            self.assertEqual(covered, [(idx, i) for idx, length in enumerate(lengths) for i in range(length)])
+
+    def test_config(self):
+        for field in ('threads', 'queue_size', 'chunk_sentences'):
+            with self.assertRaises(ValueError):
+                PipelineConfig(**{field: 0})
+
+
+class TranslationCaching(unittest.TestCase):
+    def test_persistent_pruning(self):
+        """
+        Check that expired entries and the oldest entries above the size limit are removed from the persistent cache.
+        """
+        with tempfile.TemporaryDirectory() as path, mock.patch('nmt_worker.cache.PRUNE_INTERVAL', 0):
+            cache = TranslationCache(ttl=60, path=os.path.join(path, 'cache.sqlite'), max_persistent_size=3)
+            with mock.patch('nmt_worker.cache.time', return_value=time.time() - 120):
+                cache.put('expired', 'x')
+            for idx in range(5):
+                cache.put(str(idx), str(idx))
+            keys = [key for key, in cache._db.execute("SELECT key FROM translations ORDER BY created")]
+            self.assertEqual(keys, ['2', '3', '4'])
+            cache.close()
+
+    def test_database_errors(self):
+        """
+        Check that a locked database is treated as a cache miss and does not fail the translation.
+        """
+        with tempfile.TemporaryDirectory() as path:
+            cache = TranslationCache(path=os.path.join(path, 'cache.sqlite'))
+            cache.put('a', 'A')
+            db, cache._db = cache._db, mock.Mock(execute=mock.Mock(side_effect=sqlite3.OperationalError('locked')),
+                                                 executemany=mock.Mock(side_effect=sqlite3.OperationalError('locked')))
+            self.assertEqual(cache.get('a'), 'A')
+            self.assertIsNone(cache.get('b'))
+            cache.put('b', 'B')
+            self.assertEqual(cache.get('b'), 'B')
+            db.close()
+
+    def test_engine_fingerprint(self):
+        with tempfile.TemporaryDirectory() as path:
+            model_config = tiny_model_config(path)
+            model_config.cache = CacheConfig()
+            translator = Translator(model_config, build_tiny_model(path))
+            fingerprint = translator.engine_fingerprint
+            translator.model.quantize()
+            self.assertNotEqual(translator._get_engine_fingerprint(), fingerprint)
+
+
+class BatchCalibration(unittest.TestCase):
+    def test_calibrate(self):
+        """
+        Check that calibration batches are sized by the real sentence lengths, warmed up and timed several times, and
+        that the search stops when a larger budget is slower.
+        """
+        calls = []
+
+        def translate(batch, max_sentences, max_tokens):
+            calls.append((len(batch), max_sentences, max_tokens))
+            time.sleep(0.01 + 0.0005 * len(batch) if max_tokens < 400 else 0.005 * len(batch))
+
+        budget = calibrate(translate, ['a b c', 'd e'], [10, 5], [100, 200, 400, 800], repeats=2)
+        self.assertEqual(budget, (20, 200))
+        self.assertEqual(calls, [(10, 10, 100)] * 3 + [(20, 20, 200)] * 2 + [(40, 40, 400)] * 2)
+
+
+class ModelConfiguration(unittest.TestCase):
+    def test_generation_profiles(self):
+        """
+        Check that unknown generation profile names are rejected when the config is loaded.
+        """
+        for name in ('septilang', 'mtee_general', 'mtee_legal', 'mtee_military', 'mtee_crisis', 'synest_fully_modular'):
+            read_model_config('config/config.yaml', name)
+
+        config = tiny_model_config('models/tiny').dict()
+        config['domains'][0]['generation_profile'] = 'fastest'
+        with self.assertRaises(ValueError):
+            ModelConfig(**config)
+        config['domains'][0]['generation_profile'] = 'fast'
+        config['default_generation_profile'] = 'fastest'
+        with self.assertRaises(ValueError):
+            ModelConfig(**config)
+
+
+class TorchScriptExport(unittest.TestCase):
+    def test_identical_output(self):
+        """
+        Check that the exported TorchScript generators translate exactly like the Python generators.
+        """
+        with tempfile.TemporaryDirectory() as path:
+            model = build_tiny_model(path)
+            model_config = tiny_model_config(path)
+            translator = Translator(model_config, model)
+            export_generators(model, translator.language_pairs, model_config.generation_profiles.values(), path)
+
+            rng = random.Random(1)
+            sentences = [random_sentence('et', rng) for _ in range(20)]
+            profiles = [profile.dict() for profile in model_config.generation_profiles.values()]
+            expected = [model.translate(sentences, 'et', 'en', **profile) for profile in profiles]
+
+            model.use_torchscript(path)
+            for profile, translations in zip(profiles, expected):
+                self.assertIsInstance(model.get_generator('et', 'en', **profile), torch.jit.ScriptModule)
+                self.assertEqual(model.translate(sentences, 'et', 'en', **profile), translations)
+
+
+class SelectiveLoading(unittest.TestCase):
+    @staticmethod
+    def save_checkpoint(path: str, extra_args=()) -> str:
+        model = build_tiny_model(path, language_pairs=[('et', 'en'), ('en', 'et'), ('de', 'en'), ('de', 'et')],
+                                 extra_args=extra_args)
+        checkpoint_path = os.path.join(path, 'checkpoint.pt')
+        torch.save({'cfg': model.cfg, 'model': model.models[0].state_dict(), 'extra_state': {},
+                    'optimizer_history': [{'criterion_name': 'CrossEntropyCriterion', 'optimizer_name': 'Adam',
+                                           'lr_scheduler_state': {}, 'num_updates': 0}]}, checkpoint_path)
+        return checkpoint_path
+
+    def load(self, path: str, checkpoint_path: str, language_pairs=None, lazy_loading=False) -> ModularHubInterface:
+        return ModularHubInterface.from_pretrained(model_path=checkpoint_path,
+                                                   sentencepiece_prefix=os.path.join(path, 'sp-model'),
+                                                   dictionary_path=path, language_pairs=language_pairs,
+                                                   lazy_loading=lazy_loading)
+
+    def test_selective_loading(self):
+        with tempfile.TemporaryDirectory() as path:
+            model = self.load(path, self.save_checkpoint(path), language_pairs=[('et', 'en')])
+            self.assertEqual(list(model.models[0].models), ['et-en'])
+
+    def test_lazy_loading(self):
+        """
+        Check that lazily loaded language pairs reuse the encoders and decoders that are already loaded and only read
+        the checkpoint again for the missing ones.
+        """
+        with tempfile.TemporaryDirectory() as path:
+            checkpoint_path = self.save_checkpoint(path)
+            full = self.load(path, checkpoint_path).models[0].models
+            model = self.load(path, checkpoint_path, language_pairs=[('de', 'en'), ('en', 'et')], lazy_loading=True)
+            pairs = model.models[0].models
+
+            with mock.patch.object(model, '_load', wraps=model._load) as load:
+                model.load_language_pair('de', 'et')
+                load.assert_not_called()
+                self.assertIs(pairs['de-et'].encoder, pairs['de-en'].encoder)
+                self.assertIs(pairs['de-et'].decoder, pairs['en-et'].decoder)
+
+                model.load_language_pair('et', 'en')
+                load.assert_called_once()
+                self.assertIs(pairs['et-en'].decoder, pairs['de-en'].decoder)
+
+            self.assertEqual(model.max_positions['de-et'], model.max_positions['de-en'])
+            expected = dict(full['et-en'].encoder.named_parameters())
+            for name, parameter in pairs['et-en'].encoder.named_parameters():
+                self.assertTrue(torch.equal(parameter, expected[name]), name)
+            with self.assertRaises(KeyError):
+                model.load_language_pair('en', 'de')
+
+    def test_language_tokens(self):
+        """
+        Check that selective loading is refused for models with language tokens, whose dictionaries depend on all
+        languages of the model.
+        """
+        with tempfile.TemporaryDirectory() as path:
+            checkpoint_path = self.save_checkpoint(path, ['--encoder-langtok', 'tgt', '--decoder-langtok'])
+            full = self.load(path, checkpoint_path)
+            self.assertEqual(len(full.dicts['en']), len(build_tiny_model(path).dicts['en']) + 3)
+            with self.assertRaises(ValueError):
+                self.load(path, checkpoint_path, language_pairs=[('et', 'en')])
+
+
+class ModelSnapshot(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as path:
+            model = build_tiny_model(path)
+            rng = random.Random(1)
+            sentences = [random_sentence('et', rng) for _ in range(20)]
+            snapshot_path = os.path.join(path, 'snapshot.pt')
+
+            model.save_snapshot(snapshot_path, {'model': 'tiny'})
+            self.assertEqual([name for name in os.listdir(path) if name.endswith('.tmp')], [])
+            self.assertIsNone(ModularHubInterface.load_snapshot(snapshot_path, {'model': 'other'}))
+            loaded = ModularHubInterface.load_snapshot(snapshot_path, {'model': 'tiny'})
+            self.assertEqual(loaded.translate(sentences, 'et', 'en'), model.translate(sentences, 'et', 'en'))
+
+
+class StageMetrics(unittest.TestCase):
+    @staticmethod
+    def stage_count(stage: str) -> float:
+        prefix = f'nmt_stage_duration_seconds_count{{stage="{stage}"}} '
+        return next((float(line[len(prefix):]) for line in render_metrics().splitlines() if line.startswith(prefix)), 0)
+
+    def test_shared_stages_recorded_once(self):
+        """
+        Check that the stages of a batch are recorded once for all requests, and the stages of each request once.
+        """
+        with tempfile.TemporaryDirectory() as path:
+            translator = Translator(tiny_model_config(path), build_tiny_model(path))
+            generate, normalization = self.stage_count('generate'), self.stage_count('normalization')
+            prepared = [translator.prepare_request(Request(text=f'Tere {idx}.', src='est', tgt='eng'))
+                        for idx in range(3)]
+            translator.process_prepared(prepared)
+            self.assertEqual(self.stage_count('generate'), generate + 1)
+            self.assertEqual(self.stage_count('normalization'), normalization + 3)
+            self.assertIn('generate', str(prepared[0].timings))
+
+
+class RequestPriorities(unittest.TestCase):
+    def test_gate_order(self):
+        """
+        Check that a waiting high-priority batch goes before a low-priority one that has waited longer.
+        """
+        gate = PriorityGate()
+        release = threading.Event()
+        order = []
+
+        def generate(name: str, priority: int):
+            with gate.turn(priority):
+                order.append(name)
+                if name == 'holder':
+                    release.wait(timeout=30)
+
+        threads = [threading.Thread(target=generate, args=args) for args in (('holder', 0), ('low', 0), ('high', 5))]
+        for idx, thread in enumerate(threads):
+            thread.start()
+            # wait until the thread holds the gate or is waiting for its turn
+            for _ in range(600):
+                if len(order) + len(gate._waiting) > idx:
+                    break
+                time.sleep(0.05)
+        self.assertEqual((order, len(gate._waiting)), (['holder'], 2))
+        release.set()
+        for thread in threads:
+            thread.join(timeout=30)
+        self.assertEqual(order, ['holder', 'high', 'low'])
+
+    def test_gate_configuration(self):
+        """
+        Check that requests are only reordered when batches of different requests are generated concurrently.
+        """
+        with tempfile.TemporaryDirectory() as path:
+            translator = Translator(tiny_model_config(path), build_tiny_model(path))
+            config = dict(max_priority=5, translation_threads=2, prefetch_count=10)
+            self.assertIsInstance(AsyncMQConsumer(translator, MQConfig(**config)).gate, PriorityGate)
+            self.assertIsNone(MQConsumer(translator, MQConfig(**config)).gate)
+            for override in (dict(translation_threads=1), dict(prefetch_count=1), dict(max_priority=0)):
+                self.assertIsNone(AsyncMQConsumer(translator, MQConfig(**{**config, **override})).gate)
+
+
+class FakeIOLoop:
+    """
+    Runs the callbacks that the consumer schedules on the pika I/O loop in the test thread.
+    """
+    def __init__(self):
+        self.callbacks = queue.Queue()
+        self.timers = []
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.put(callback)
+
+    def call_later(self, delay, callback):
+        self.timers.append(callback)
+
+    def run_until(self, condition, timeout: float = 30):
+        for _ in range(int(timeout / 0.05)):
+            if condition():
+                return
+            try:
+                self.callbacks.get(timeout=0.05)()
+            except queue.Empty:  # nothing else is running, so pending batches are due
+                timers, self.timers = self.timers, []
+                for callback in timers:
+                    callback()
+        raise TimeoutError()
+
+
+class FakeChannel:
+    """
+    Records the responses and acknowledgements of the consumer instead of sending them to RabbitMQ.
+    """
+    is_open = True
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.responses = {}
+        self.acknowledged = []
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.responses[properties.correlation_id] = json.loads(body)
+
+    def basic_ack(self, delivery_tag):
+        self.acknowledged.append(delivery_tag)
+
+
+class AsyncConsumer(unittest.TestCase):
+    translator: Translator
+    path: tempfile.TemporaryDirectory
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = tempfile.TemporaryDirectory()
+        cls.translator = Translator(tiny_model_config(cls.path.name), build_tiny_model(cls.path.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.path.cleanup()
+
+    def consume(self, consumer: AsyncMQConsumer, bodies):
+        consumer.connection = mock.Mock(ioloop=FakeIOLoop())
+        consumer.channel = FakeChannel(consumer.connection)
+        for idx, body in enumerate(bodies):
+            consumer._on_message(consumer.channel, pika.spec.Basic.Deliver(delivery_tag=idx),
+                                 pika.BasicProperties(correlation_id=str(idx), reply_to='reply'),
+                                 json.dumps(body).encode())
+        consumer.connection.ioloop.run_until(lambda: len(consumer.channel.acknowledged) == len(bodies))
+        consumer.executor.shutdown()
+        self.assertCountEqual(consumer.channel.acknowledged, range(len(bodies)))
+        return [consumer.channel.responses[str(idx)] for idx in range(len(bodies))]
+
+    def test_single_requests(self):
+        consumer = AsyncMQConsumer(self.translator, MQConfig(translation_threads=2))
+        responses = self.consume(consumer, [{'text': 'Tere maailm.', 'src': 'est', 'tgt': 'eng'},
+                                            {'text': ['Tere.', 'Aitäh.'], 'src': 'est', 'tgt': 'eng'},
+                                            {'text': 'Tere.'}])
+        self.assertEqual([response['status_code'] for response in responses], [200, 200, 400])
+        self.assertIsInstance(responses[0]['result'], str)
+        self.assertEqual(len(responses[1]['result']), 2)
+
+    def test_batched_requests(self):
+        consumer = AsyncMQConsumer(self.translator, MQConfig(prefetch_count=10, translation_threads=2))
+        responses = self.consume(consumer, [{'text': f'Tere maailm {idx}.', 'src': 'est', 'tgt': 'eng'}
+                                            for idx in range(5)] + [{'text': 'Tere.', 'src': 'est'}])
+        self.assertEqual([response['status_code'] for response in responses], [200] * 5 + [400])
+        self.assertFalse(consumer.batcher.pending)
+
+    def test_request_errors(self):
+        """
+        Check that invalid requests get a 400 response and translation errors a 500 response with and without
+        micro-batching.
+        """
+        bodies = [{'text': 'Tere.', 'src': 'est'}, {'text': 'Tere.', 'src': 'est', 'tgt': 'eng'}]
+        for mq_config, method in ((MQConfig(), 'process_request'), (MQConfig(prefetch_count=10), 'prepare_request')):
+            consumer = AsyncMQConsumer(self.translator, mq_config)
+            with mock.patch.object(self.translator, method, side_effect=RuntimeError):
+                responses = self.consume(consumer, bodies)
+            self.assertEqual([response['status_code'] for response in responses], [400, 500])
+
+    def test_unexpected_error(self):
+        for mq_config in (MQConfig(), MQConfig(prefetch_count=10)):
+            consumer = AsyncMQConsumer(self.translator, mq_config)
+            with mock.patch.object(consumer, '_process', side_effect=RuntimeError), \
+                    mock.patch.object(consumer, '_process_batch', side_effect=RuntimeError):
+                responses = self.consume(consumer, [{'text': 'Tere.', 'src': 'est', 'tgt': 'eng'}] * 2)
+            self.assertEqual([response['status_code'] for response in responses], [500, 500])
+
 
 if __name__ == '__main__':
     unittest.main()